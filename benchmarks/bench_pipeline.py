@@ -0,0 +1,130 @@
+import argparse
+import asyncio
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from fakes import FakeTranslator, FeedServer, make_fake_gemini
+from fixtures import FEEDS, WIDE_HISTORY, load_fixtures, record
+
+import translation_plan  # noqa: E402
+from extractor import build_rows  # noqa: E402
+from fetch_feeds import fetch_all  # noqa: E402
+from normalize import normalize_rows  # noqa: E402
+from parquet_store import write_segment  # noqa: E402
+from row_index import append_new_rows  # noqa: E402
+from sqlite_store import connect, write_run  # noqa: E402
+from summarize import summarize_all  # noqa: E402
+from translation_cache import TranslationCache  # noqa: E402
+
+SKIP_TRANSLATION = ["url", "traffic", "date", "time", "snapshot"]
+
+
+def scaled_feeds(scale):
+    if scale == 1:
+        return list(FEEDS)
+    return [(f"{geo}{i}", lang, country) for i in range(scale) for geo, lang, country in FEEDS]
+
+
+def seed_history(path, scale):
+    # The archived v4 snapshot repeated `scale` times under distinct snapshot
+    # stamps, standing in for `scale`x today's history.
+    with open(WIDE_HISTORY, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        rows = list(reader)
+        fieldnames = reader.fieldnames
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, lineterminator="\n")
+        writer.writeheader()
+        for i in range(scale):
+            for row in rows:
+                writer.writerow(dict(row, snapshot=f"{row['snapshot']} #{i}"))
+
+
+def run_once(scale, fixtures, fetch_latency, with_ai):
+    feeds = scaled_feeds(scale)
+    by_geo = {geo: fixtures[geo[:2]] for geo, _, _ in feeds}
+    timings = {}
+    snapshot = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+    with FeedServer(by_geo, latency=fetch_latency) as server:
+        start = time.perf_counter()
+        fetched = fetch_all(feeds, feed_url=server.feed_url)
+        timings["fetch"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rows, news_by_row, pub_dates = build_rows(fetched, snapshot)
+    timings["parse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    normalize_rows(rows, pub_dates)
+    timings["normalize"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    text_columns = [c for c in rows[0] if not any(s in c.lower() for s in SKIP_TRANSLATION)]
+    cache = TranslationCache()
+    plan = translation_plan.plan_translations(rows, text_columns)
+    translations, _ = translation_plan.translate_plan(plan, cache)
+    translation_plan.apply_translations(rows, text_columns, translations)
+    cache.close()
+    timings["translate"] = time.perf_counter() - start
+
+    if with_ai:
+        start = time.perf_counter()
+        limits = {"MAX_RPM": 10**9, "MAX_TPM": 10**12, "MAX_RPD": 10**9, "TOKEN_ESTIMATE": 1}
+        trends = [(row["trend_title"], row["country"], row["traffic"] or 0) for row in rows]
+        asyncio.run(summarize_all(trends, limits=limits, call=make_fake_gemini()))
+        timings["summarize"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    append_new_rows(rows, os.path.join("data", "trending_now_snapshot.csv"))
+    timings["dedup"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    write_segment(rows)
+    conn = connect()
+    write_run(conn, snapshot, rows, news_by_row)
+    conn.close()
+    timings["write"] = time.perf_counter() - start
+    return len(feeds), len(rows), timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each pipeline stage offline.")
+    parser.add_argument("--scales", default="1,10,100", help="feed count and history multipliers")
+    parser.add_argument("--fetch-latency", type=float, default=0.05, help="seconds per fake feed response")
+    parser.add_argument("--translate-latency", type=float, default=0.0, help="seconds per fake translation")
+    parser.add_argument("--with-ai", action="store_true", help="include summarization with a fake Gemini")
+    parser.add_argument("--record", action="store_true", help="record live feeds as fixtures first")
+    args = parser.parse_args()
+
+    if args.record:
+        print(f"Recorded fixtures in {record()}", flush=True)
+    fixtures = load_fixtures()
+    FakeTranslator.latency = args.translate_latency
+    translation_plan.make_translator = lambda lang: FakeTranslator(source=lang, target="en")
+
+    stages = ["fetch", "parse", "normalize", "translate"] + (["summarize"] if args.with_ai else []) + ["dedup", "write"]
+    print(f"{'scale':>5} {'feeds':>6} {'rows':>7} " + " ".join(f"{s:>10}" for s in stages), flush=True)
+
+    cwd = os.getcwd()
+    for scale in [int(s) for s in args.scales.split(",")]:
+        workdir = tempfile.mkdtemp(prefix="trends-bench-")
+        try:
+            os.chdir(workdir)
+            os.makedirs("data")
+            seed_history(os.path.join("data", "trending_now_snapshot.csv"), scale)
+            feeds, rows, timings = run_once(scale, fixtures, args.fetch_latency, args.with_ai)
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(workdir, ignore_errors=True)
+        print(f"{scale:>5} {feeds:>6} {rows:>7} " + " ".join(f"{timings[s] * 1000:>8.1f}ms" for s in stages),
+              flush=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
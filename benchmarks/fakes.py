@@ -0,0 +1,74 @@
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeTranslator:
+    # Drop-in for deep_translator.GoogleTranslator with a fixed per-string cost.
+    latency = 0.0
+    calls = 0
+
+    def __init__(self, source="auto", target="en", **kwargs):
+        self.source = source
+
+    def translate(self, text, **kwargs):
+        FakeTranslator.calls += 1
+        time.sleep(self.latency)
+        return f"[{self.source}] {text[::-1]}"
+
+    def translate_batch(self, batch, **kwargs):
+        return [self.translate(text) for text in batch]
+
+
+def make_fake_gemini(latency=0.0):
+    def call(trend, country):
+        time.sleep(latency)
+        return f"סיכום: {trend} ({country})"
+    return call
+
+
+class FeedServer:
+    # Local stand-in for trends.google.com/trending/rss serving fixtures by geo.
+    def __init__(self, fixtures, latency=0.0):
+        self.fixtures = fixtures
+        self.latency = latency
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+                geo = query.get("geo", [""])[0]
+                body = server.fixtures.get(geo)
+                time.sleep(server.latency)
+                if body is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/rss+xml; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def feed_url(self):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}/trending/rss?geo={{geo}}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,90 @@
+import csv
+import glob
+import os
+import sys
+from xml.sax.saxutils import escape
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+
+from fetch_feeds import FEEDS  # noqa: E402
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+WIDE_HISTORY = os.path.join(ROOT, "data", "old_data", "trending_now_snapshot.csv")
+ORIGINAL_TITLES = os.path.join(ROOT, "data", "old_data", "trending_now_snapshot_v1.csv")
+ITEMS_PER_FEED = 20
+
+
+def record(feeds=FEEDS, out_dir=FIXTURE_DIR):
+    # Saves the live feeds so later runs replay exactly what Google served.
+    import requests
+
+    os.makedirs(out_dir, exist_ok=True)
+    for geo, _, _ in feeds:
+        body = requests.get(f"https://trends.google.com/trending/rss?geo={geo}", timeout=30).content
+        with open(os.path.join(out_dir, f"{geo}.xml"), "wb") as f:
+            f.write(body)
+    return out_dir
+
+
+def _read_csv(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return list(csv.DictReader(f))
+
+
+def _tag(name, value):
+    return f"<{name}>{escape(value)}</{name}>" if value else ""
+
+
+def synthesize(geo, country, wide_rows, titles, items=ITEMS_PER_FEED):
+    # An RSS document in Google's format built from archived rows: original
+    # (untranslated) titles from v1 and the news items kept by v4.
+    out = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<rss xmlns:atom="http://www.w3.org/2005/Atom" xmlns:ht="https://trends.google.com/trending/rss" version="2.0">',
+        "<channel><title>Daily Search Trends</title>",
+        f"<link>https://trends.google.com/trending/rss?geo={geo}</link>",
+    ]
+    country_rows = [r for r in wide_rows if r["country"] == country] or wide_rows
+    country_titles = titles.get(country) or [r["trend_title"] for r in country_rows]
+    for i in range(items):
+        row = country_rows[i % len(country_rows)]
+        out.append("<item>")
+        out.append(_tag("title", country_titles[i % len(country_titles)]))
+        out.append(_tag("ht:approx_traffic", f"{(i % 9 + 1) * 100}{'K' if i % 5 == 0 else ''}+"))
+        out.append(_tag("link", f"https://trends.google.com/trending/rss?geo={geo}"))
+        out.append(_tag("pubDate", f"Thu, 26 Mar 2026 {i % 24:02d}:00:00 -0700"))
+        out.append(_tag("ht:picture", row["picture_url"]))
+        for n in range(1, 4):
+            if not row.get(f"news_item_title_{n}"):
+                continue
+            out.append("<ht:news_item>")
+            out.append(_tag("ht:news_item_title", row[f"news_item_title_{n}"]))
+            out.append(_tag("ht:news_item_url", row[f"news_item_url_{n}"]))
+            out.append(_tag("ht:news_item_picture", row[f"news_item_picture_{n}"]))
+            out.append(_tag("ht:news_item_source", row[f"news_item_source_{n}"]))
+            out.append("</ht:news_item>")
+        out.append("</item>")
+    out.append("</channel></rss>")
+    return "".join(out).encode("utf-8")
+
+
+def load_fixtures(feeds=FEEDS, fixture_dir=FIXTURE_DIR):
+    # {geo: rss bytes}; recorded files win, the rest are synthesized.
+    recorded = {
+        os.path.splitext(os.path.basename(p))[0]: p
+        for p in glob.glob(os.path.join(fixture_dir, "*.xml"))
+    }
+    wide_rows = _read_csv(WIDE_HISTORY)
+    titles = {}
+    for row in _read_csv(ORIGINAL_TITLES):
+        titles.setdefault(row["country_en"], []).append(row["title_original"])
+
+    fixtures = {}
+    for geo, _, country in feeds:
+        if geo in recorded:
+            with open(recorded[geo], "rb") as f:
+                fixtures[geo] = f.read()
+        else:
+            fixtures[geo] = synthesize(geo, country, wide_rows, titles)
+    return fixtures
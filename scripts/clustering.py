@@ -0,0 +1,199 @@
+import argparse
+import hashlib
+
+import numpy as np
+
+from normalize import normalize_title
+from sqlite_store import DB_PATH, connect, transaction
+
+SHINGLE_SIZE = 3
+BANDS = 16
+ROWS_PER_BAND = 4
+NUM_HASHES = BANDS * ROWS_PER_BAND
+# Candidates sharing an LSH bucket are only merged when their signatures
+# agree on at least this share of the hashes (estimated Jaccard similarity).
+SIMILARITY_THRESHOLD = 0.5
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20260326)
+_A = _rng.integers(1, _PRIME, size=NUM_HASHES, dtype=np.int64)
+_B = _rng.integers(0, _PRIME, size=NUM_HASHES, dtype=np.int64)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS clusters (
+    id INTEGER PRIMARY KEY,
+    label TEXT,
+    signature BLOB NOT NULL,
+    first_seen TEXT
+);
+
+CREATE TABLE IF NOT EXISTS cluster_buckets (
+    band INTEGER NOT NULL,
+    bucket TEXT NOT NULL,
+    cluster_id INTEGER NOT NULL REFERENCES clusters (id),
+    PRIMARY KEY (band, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS trend_clusters (
+    trend_id INTEGER PRIMARY KEY REFERENCES trends (id),
+    cluster_id INTEGER NOT NULL REFERENCES clusters (id)
+);
+
+CREATE INDEX IF NOT EXISTS trend_clusters_cluster ON trend_clusters (cluster_id);
+"""
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    text = normalize_title(text)
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def signature(text):
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") % _PRIME
+         for s in shingles(text)),
+        dtype=np.int64,
+    )
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1)
+
+
+def similarity(sig_a, sig_b):
+    return float(np.mean(sig_a == sig_b))
+
+
+def band_keys(sig):
+    rows = sig.reshape(BANDS, ROWS_PER_BAND)
+    return [hashlib.blake2b(row.tobytes(), digest_size=8).hexdigest() for row in rows]
+
+
+class _UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        ri, rj = self.find(i), self.find(j)
+        if ri != rj:
+            self.parent[max(ri, rj)] = min(ri, rj)
+
+
+def ensure_schema(conn):
+    conn.executescript(SCHEMA)
+
+
+def assign_clusters(conn, texts, labels, seen_at, commit=True):
+    # Returns one cluster id per text. Texts are grouped with each other and
+    # with earlier runs through shared LSH buckets, so cost grows linearly
+    # with the number of texts instead of comparing every pair.
+    # With commit=False (see trend_lifetime.update) the caller has run
+    # ensure_schema and commits.
+    if commit:
+        ensure_schema(conn)
+    sigs = [signature(text) for text in texts]
+    keys = [band_keys(sig) for sig in sigs]
+
+    uf = _UnionFind(len(texts))
+    buckets = {}
+    for i, item_keys in enumerate(keys):
+        for band, key in enumerate(item_keys):
+            first = buckets.setdefault((band, key), i)
+            if first != i and similarity(sigs[i], sigs[first]) >= SIMILARITY_THRESHOLD:
+                uf.union(i, first)
+
+    components = {}
+    for i in range(len(texts)):
+        components.setdefault(uf.find(i), []).append(i)
+
+    cluster_ids = [None] * len(texts)
+    with transaction(conn, commit):
+        for members in components.values():
+            # Reuse the oldest matching cluster from earlier runs, if any.
+            existing = set()
+            for i in members:
+                for band, key in enumerate(keys[i]):
+                    row = conn.execute(
+                        """
+                        SELECT c.id, c.signature FROM cluster_buckets b JOIN clusters c ON c.id = b.cluster_id
+                        WHERE b.band = ? AND b.bucket = ?
+                        """,
+                        (band, key),
+                    ).fetchone()
+                    if row and similarity(sigs[i], np.frombuffer(row[1], dtype=np.int64)) >= SIMILARITY_THRESHOLD:
+                        existing.add(row[0])
+
+            if existing:
+                cluster_id = min(existing)
+            else:
+                head = members[0]
+                cluster_id = conn.execute(
+                    "INSERT INTO clusters (label, signature, first_seen) VALUES (?, ?, ?)",
+                    (labels[head], sigs[head].tobytes(), seen_at),
+                ).lastrowid
+
+            conn.executemany(
+                "INSERT OR IGNORE INTO cluster_buckets (band, bucket, cluster_id) VALUES (?, ?, ?)",
+                [(band, key, cluster_id) for i in members for band, key in enumerate(keys[i])],
+            )
+            for i in members:
+                cluster_ids[i] = cluster_id
+    return cluster_ids
+
+
+def cluster_snapshot(conn, snapshot_id, commit=True):
+    # Clusters the trends of one stored snapshot on their title plus news
+    # headlines and records trend -> cluster in trend_clusters.
+    trends = conn.execute(
+        """
+        SELECT t.id, t.title, sn.taken_at,
+               COALESCE((SELECT GROUP_CONCAT(n.title, ' ') FROM news_items n WHERE n.trend_id = t.id), '')
+        FROM trends t JOIN snapshots sn ON sn.id = t.snapshot_id
+        WHERE t.snapshot_id = ? AND t.title IS NOT NULL
+        ORDER BY t.id
+        """,
+        (snapshot_id,),
+    ).fetchall()
+    if not trends:
+        return {}
+
+    texts = [f"{title} {headlines}" for _, title, _, headlines in trends]
+    labels = [title for _, title, _, _ in trends]
+    cluster_ids = assign_clusters(conn, texts, labels, trends[0][2], commit)
+    with transaction(conn, commit):
+        conn.executemany(
+            "INSERT OR REPLACE INTO trend_clusters (trend_id, cluster_id) VALUES (?, ?)",
+            [(trend[0], cluster_id) for trend, cluster_id in zip(trends, cluster_ids)],
+        )
+    return dict(zip((trend[0] for trend in trends), cluster_ids))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cluster stored trends across countries and runs.")
+    parser.add_argument("--rebuild", action="store_true", help="re-cluster every snapshot in the store")
+    parser.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    if args.rebuild:
+        conn.executescript(SCHEMA)
+        with conn:
+            conn.execute("DELETE FROM trend_clusters")
+            conn.execute("DELETE FROM cluster_buckets")
+            conn.execute("DELETE FROM clusters")
+        for (snapshot_id,) in conn.execute("SELECT id FROM snapshots ORDER BY taken_at").fetchall():
+            cluster_snapshot(conn, snapshot_id)
+    conn.executescript(SCHEMA)
+    rows = conn.execute("""
+        SELECT c.id, c.label, COUNT(DISTINCT t.geo) AS geos, COUNT(*) AS trends
+        FROM trend_clusters tc JOIN clusters c ON c.id = tc.cluster_id JOIN trends t ON t.id = tc.trend_id
+        GROUP BY c.id HAVING geos > 1 ORDER BY geos DESC, trends DESC LIMIT 20
+    """).fetchall()
+    for cluster_id, label, geos, trends in rows:
+        print(f"{cluster_id:>6}  {geos:>3} geos  {trends:>4} trends  {label}", flush=True)
+    conn.close()
@@ -0,0 +1,20 @@
+import os
+import time
+
+# Wall-clock budget for a whole run, in seconds (override with RUN_DEADLINE).
+RUN_DEADLINE = float(os.getenv("RUN_DEADLINE", "600"))
+
+
+class Deadline:
+    def __init__(self, seconds=RUN_DEADLINE, ends_at=None):
+        self.ends_at = ends_at if ends_at is not None else time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.ends_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def reserve(self, seconds):
+        # The same deadline minus `seconds` kept back for the stages that follow.
+        return Deadline(ends_at=self.ends_at - seconds)
@@ -0,0 +1,513 @@
+import os
+from datetime import datetime
+from xml.etree.ElementTree import ParseError
+from deadline import Deadline
+from feed_parser import parse_feed
+from fetch_feeds import FEEDS, fetch_all, fetch_iter, load_feed_state, restore_feed_state, save_feed_state
+from links import LinkTable, intern_rows
+from migrate_legacy import restore_store
+from translation_cache import TranslationCache
+from normalize import normalize_rows
+from parquet_store import write_segment
+from pipeline import Pipeline
+from raw_archive import archive_feeds
+from row_index import CsvAppender
+from run_metrics import RunMetrics
+from snapshot_diff import CHANGE_KINDS, last_trends, load_state as load_diff_state, record_run as record_changes
+from sqlite_store import connect, set_summaries, write_run
+from summarize import BackgroundSummaries
+from trend_lifetime import ensure_schema as ensure_lifetime_schema, update as update_lifetimes
+from translation_plan import plan_translations, translate_plan, apply_translations
+
+USE_AI = False
+
+SNAPSHOT_PATH = os.path.join("data", "trending_now_snapshot.csv")
+SKIP_TRANSLATION = ["url", "traffic", "date", "time", "snapshot"]
+
+# Seconds of the run deadline kept back for the stages after fetching
+# (translate, summarize, store) and after translating (store).
+FETCH_RESERVE = 120
+STORE_RESERVE = 30
+
+
+def new_snapshot():
+    return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def fetch(feeds, metrics, feed_state, session=None, deadline=None, failures=None):
+    # Feeds that fail or run past the deadline are left out of the run and
+    # listed under the fetch stage's "missing_feeds" (and in `failures`, if
+    # given); the rest carry on.
+    failures = {} if failures is None else failures
+    with metrics.stage("fetch") as stage:
+        fetch_deadline = deadline.reserve(FETCH_RESERVE) if deadline is not None else None
+        fetched = fetch_all(feeds, state=feed_state, session=session, deadline=fetch_deadline, failures=failures)
+        skipped_feeds = sum(1 for geo, *_, body in fetched if body is None and geo not in failures)
+        stage["feeds"] = stage.get("feeds", 0) + len(fetched)
+        stage["unchanged_feeds"] = stage.get("unchanged_feeds", 0) + skipped_feeds
+        stage["bytes"] = stage.get("bytes", 0) + sum(len(body) for *_, body in fetched if body is not None)
+
+    print(f"Fetched {len(feeds)} feeds, {skipped_feeds} unchanged since the last run", flush=True)
+    report_missing(metrics, failures)
+    return fetched
+
+
+def report_missing(metrics, missing):
+    metrics.stages.setdefault("fetch", {}).setdefault("missing_feeds", {}).update(missing)
+    for geo, reason in missing.items():
+        print(f"⚠️ Feed {geo} missing from this run: {reason}", flush=True)
+
+
+def build_rows(fetched, snapshot, failures=None):
+    # A feed that is not valid XML (an HTML error page served with a 200)
+    # is left out and listed in `failures` ({geo: reason}), if given.
+    rows = []
+    news_by_row = []
+    pub_dates = []
+
+    for geo, lang, country, body in fetched:
+        if body is None:
+            continue
+        try:
+            items = list(parse_feed(body))
+        except ParseError as e:
+            if failures is None:
+                raise
+            failures[geo] = f"unreadable feed: {e}"
+            continue
+
+        for item in items:
+            title = item.title
+            url_pic = item.picture
+            pub_dates.append(item.pub_date)
+
+            news_titles = [None, None, None]
+            news_urls = [None, None, None]
+            news_pictures = [None, None, None]
+            news_sources = [None, None, None]
+
+            for i, news in enumerate(item.news[:3]):
+                news_titles[i], news_urls[i], news_pictures[i], news_sources[i] = news
+
+            rows.append({
+                "geo": geo,
+                "language": lang,
+                "country": country,
+                "trend_title": title,
+                # traffic, date and times are filled in by normalize_rows
+                "traffic": item.traffic,
+                "date": None,
+                "start_time": None,
+                "end_time": None,
+                "picture_url": url_pic,
+                "news_item_title_1": news_titles[0],
+                "news_item_url_1": news_urls[0],
+                "news_item_picture_1": news_pictures[0],
+                "news_item_source_1": news_sources[0],
+                "news_item_title_2": news_titles[1],
+                "news_item_url_2": news_urls[1],
+                "news_item_picture_2": news_pictures[1],
+                "news_item_source_2": news_sources[1],
+                "news_item_title_3": news_titles[2],
+                "news_item_url_3": news_urls[2],
+                "news_item_picture_3": news_pictures[2],
+                "news_item_source_3": news_sources[2],
+                "snapshot": snapshot
+            })
+            news_by_row.append(item.news)
+
+    return rows, news_by_row, pub_dates
+
+
+def translate_rows(rows, news_by_row, cache, deadline=None):
+    # Translates the text columns of `rows` and the titles and sources of
+    # every news item in place. Returns the news lists, the number of
+    # distinct strings, the number of translator calls and the geos left
+    # with untranslated strings (deadline reached or a batch failed).
+    text_columns = [
+        col for col in rows[0]
+        if not any(skip in col.lower() for skip in SKIP_TRANSLATION)
+    ]
+    # The SQLite store keeps every news item, not only the three CSV slots.
+    news_texts = [
+        (row["language"], text)
+        for row, news_items in zip(rows, news_by_row)
+        for news in news_items
+        for text in (news.title, news.source)
+    ]
+    plan = plan_translations(rows, text_columns, extra=news_texts)
+    translate_deadline = deadline.reserve(STORE_RESERVE) if deadline is not None else None
+    translations, calls = translate_plan(plan, cache, deadline=translate_deadline)
+    missing = {(lang, text) for lang, texts in plan.items() for text in texts} - translations.keys()
+    untranslated = {
+        row["geo"]
+        for row, news_items in zip(rows, news_by_row)
+        if any((row["language"], row.get(col)) in missing for col in text_columns)
+        or any((row["language"], text) in missing for news in news_items for text in (news.title, news.source))
+    } if missing else set()
+    apply_translations(rows, text_columns, translations)
+    news_by_row = [
+        [
+            news._replace(
+                title=translations.get((row["language"], news.title), news.title),
+                source=translations.get((row["language"], news.source), news.source),
+            )
+            for news in news_items
+        ]
+        for row, news_items in zip(rows, news_by_row)
+    ]
+    return news_by_row, sum(len(texts) for texts in plan.values()), calls, untranslated
+
+
+def hold_back_untranslated(metrics, held_back, geos):
+    # Like an unreadable feed, a geo left with untranslated strings is not
+    # stored this run (next run would add a second, translated copy of its
+    # trends) and is reported missing; the feed is fetched in full again.
+    missing = {geo: "untranslated strings" for geo in sorted(geos)}
+    held_back.update(missing)
+    report_missing(metrics, missing)
+
+
+def count_translations(stage, cache, hits, misses, unique_strings, calls):
+    hits, misses = cache.hits - hits, cache.misses - misses
+    stage["unique_strings"] = stage.get("unique_strings", 0) + unique_strings
+    stage["batches"] = stage.get("batches", 0) + calls
+    stage["cache_hits"] = stage.get("cache_hits", 0) + hits
+    stage["cache_misses"] = stage.get("cache_misses", 0) + misses
+    lookups = stage["cache_hits"] + stage["cache_misses"]
+    stage["cache_hit_rate"] = round(stage["cache_hits"] / lookups, 4) if lookups else 0.0
+
+
+def print_translations(stage):
+    print(
+        f"Translated {stage.get('unique_strings', 0)} unique strings in {stage.get('batches', 0)} batches "
+        f"(cache: {stage.get('cache_hits', 0)} hits, {stage.get('cache_misses', 0)} misses)",
+        flush=True
+    )
+
+
+def prepare(fetched, snapshot, metrics, cache=None, deadline=None, held_back=None, archive=archive_feeds):
+    # Parse, normalize and translate the fetched feeds into the snapshot
+    # rows (plain dicts, no DataFrame on the hot path) plus the full
+    # (translated) news item list of every row, all at once.
+    # A long-lived `cache` (poller) is flushed but left open.
+    # Geos whose feed state must not move forward are added to `held_back`
+    # ({geo: reason}); unreadable feeds are also reported as missing.
+    # `archive(fetched, snapshot)` keeps the raw bodies that parsed.
+    held_back = {} if held_back is None else held_back
+    with metrics.stage("parse") as stage:
+        unreadable = {}
+        rows, news_by_row, pub_dates = build_rows(fetched, snapshot, unreadable)
+        stage["items"] = len(rows)
+        stage["news_items"] = sum(len(news_items) for news_items in news_by_row)
+    report_missing(metrics, unreadable)
+    held_back.update(unreadable)
+
+    with metrics.stage("archive") as stage:
+        readable = [entry for entry in fetched if entry[0] not in unreadable]
+        stage["blobs_written"] = stage.get("blobs_written", 0) + archive(readable, snapshot)
+
+    if not rows:
+        return [], []
+
+    with metrics.stage("normalize"):
+        normalize_rows(rows, pub_dates)
+
+    with metrics.stage("translate") as stage:
+        own_cache = cache is None
+        if own_cache:
+            cache = TranslationCache()
+        hits, misses = cache.hits, cache.misses
+        news_by_row, unique_strings, calls, untranslated = translate_rows(rows, news_by_row, cache, deadline)
+        count_translations(stage, cache, hits, misses, unique_strings, calls)
+        if own_cache:
+            cache.close()
+        else:
+            cache.flush()
+
+    print_translations(stage)
+    if untranslated:
+        hold_back_untranslated(metrics, held_back, untranslated)
+        kept = [i for i, row in enumerate(rows) if row["geo"] not in untranslated]
+        rows, news_by_row = [rows[i] for i in kept], [news_by_row[i] for i in kept]
+    return rows, news_by_row
+
+
+class SnapshotSink:
+    # The storage end of a run. Each batch of rows is deduplicated into the
+    # CSV, written to Parquet and SQLite as soon as it arrives; the steps
+    # that need the whole snapshot (clustering, diff, rollups) run in
+    # close() on a few fields per trend kept for them. Gemini summaries are
+    # requested in the background from the first batch on, so they overlap
+    # with fetching and translating the rest. The CSV and Parquet rows
+    # refer to their links by id (links.py).
+    # All SQLite writes of the run are one transaction, committed in close():
+    # a run that fails leaves no partial snapshot in trends.sqlite. The diff
+    # and rollup files are only updated once it is committed.
+    # `done` collects the steps that are finished ("sqlite", "diff",
+    # "rollups"); a caller that retries a failed snapshot (the poller)
+    # passes the same set back so they are not applied twice.
+    def __init__(self, snapshot, metrics, use_ai=USE_AI, deadline=None, done=None):
+        self.snapshot = snapshot
+        self.metrics = metrics
+        self.deadline = deadline
+        os.makedirs(os.path.dirname(SNAPSHOT_PATH), exist_ok=True)
+        self.appender = CsvAppender(SNAPSHOT_PATH)
+        self.links = LinkTable()
+        restore_store()
+        self.conn = connect()
+        # Tables are created before the transaction starts: executescript
+        # would commit it.
+        ensure_lifetime_schema(self.conn)
+        self.done = set() if done is None else done
+        self.snapshot_id = None
+        self.trends = []
+        self.written = 0
+        self.skipped = 0
+        self.segments = 0
+        self.unchanged = []
+        self.summaries = None
+        if use_ai:
+            self.summaries = BackgroundSummaries(
+                deadline=deadline.reserve(STORE_RESERVE) if deadline is not None else None)
+
+    def write(self, batch):
+        rows, news_by_row = batch
+        with self.metrics.stage("links") as stage:
+            linked_rows = intern_rows(rows, self.links)
+            # New links are on disk before any row that refers to them.
+            stage["links_added"] = stage.get("links_added", 0) + self.links.flush()
+
+        with self.metrics.stage("dedup") as stage:
+            written, skipped = self.appender.append(linked_rows)
+            self.written += written
+            self.skipped += skipped
+            stage.update(rows_in=self.written + self.skipped, rows_written=self.written,
+                         duplicates_dropped=self.skipped)
+
+        with self.metrics.stage("write") as stage:
+            self.segments += len(write_segment(linked_rows))
+            stage["parquet_segments"] = self.segments
+            if "sqlite" not in self.done:
+                if self.snapshot_id is None:
+                    # Clustering pulls in numpy; only load it once there is something to store.
+                    from clustering import ensure_schema as ensure_cluster_schema
+
+                    ensure_cluster_schema(self.conn)
+                self.snapshot_id = write_run(self.conn, self.snapshot, rows, news_by_row, commit=False)
+                stage["sqlite_trends"] = stage.get("sqlite_trends", 0) + len(rows)
+                stage["lifetimes_updated"] = (stage.get("lifetimes_updated", 0)
+                                              + update_lifetimes(self.conn, self.snapshot, rows, commit=False))
+
+        self.trends.extend(
+            {"geo": row["geo"], "country": row["country"], "trend_title": row["trend_title"],
+             "traffic": row["traffic"]}
+            for row in rows
+        )
+        if self.summaries is not None and "sqlite" not in self.done:
+            self.summaries.add((row["trend_title"], row["country"], row["traffic"] or 0) for row in rows)
+
+    def mark_unchanged(self, geos):
+        # Geos whose feed was skipped as unchanged: their trends are still
+        # on the feed, and their lifetimes are extended when the sink closes.
+        self.unchanged.extend(geos)
+
+    def close(self, complete=True):
+        # With complete=False (a failed run) only the files are closed and
+        # the SQLite writes are rolled back.
+        self.appender.close()
+        self.links.close()
+        try:
+            if complete:
+                self.finish()
+        finally:
+            if self.summaries is not None:
+                self.summaries.result(cancel=True)
+            if "sqlite" not in self.done:
+                self.conn.rollback()
+            self.conn.close()
+        return self.written
+
+    def finish(self):
+        # The trends of feeds skipped as unchanged are seen again at this
+        # snapshot: they count toward lifetimes and rollups like stored ones.
+        unchanged = last_trends(load_diff_state(), self.unchanged)
+        if self.trends:
+            print(f"Appended {self.written} new rows ({self.skipped} already in {SNAPSHOT_PATH})", flush=True)
+            print(f"Wrote {self.segments} Parquet segments", flush=True)
+
+        if "sqlite" not in self.done:
+            self.finish_sqlite(unchanged)
+            self.done.add("sqlite")
+
+        if self.trends and "diff" not in self.done:
+            with self.metrics.stage("diff") as stage:
+                changes = record_changes(self.trends, self.snapshot)
+                counts = {kind: sum(1 for c in changes if c["change"] == kind) for kind in CHANGE_KINDS}
+                for kind, count in counts.items():
+                    stage[kind] = stage.get(kind, 0) + count
+            self.done.add("diff")
+            print("Changes since the last snapshot: " + ", ".join(f"{n} {kind}" for kind, n in counts.items()),
+                  flush=True)
+
+        if (self.trends or unchanged) and "rollups" not in self.done:
+            with self.metrics.stage("write") as stage:
+                # Rollups pull in numpy too.
+                from rollups import update as update_rollups
+
+                stage["rollup_cells_added"] = (stage.get("rollup_cells_added", 0)
+                                               + update_rollups(self.trends + unchanged, self.snapshot))
+            self.done.add("rollups")
+
+    def finish_sqlite(self, unchanged):
+        if unchanged:
+            with self.metrics.stage("write") as stage:
+                stage["lifetimes_updated"] = (stage.get("lifetimes_updated", 0)
+                                              + update_lifetimes(self.conn, self.snapshot, unchanged, commit=False))
+
+        if self.snapshot_id is not None:
+            with self.metrics.stage("write") as stage:
+                from clustering import cluster_snapshot
+
+                stage["clusters"] = len(set(cluster_snapshot(self.conn, self.snapshot_id, commit=False).values()))
+
+            if self.summaries is not None:
+                with self.metrics.stage("summarize") as stage:
+                    summary_by_trend = self.summaries.result()
+                    self.summaries = None
+                    set_summaries(self.conn, self.snapshot_id, summary_by_trend, commit=False)
+                    stage["summaries"] = sum(1 for s in summary_by_trend.values() if s)
+
+        with self.metrics.stage("write"):
+            self.conn.commit()
+
+
+def store(rows, news_by_row, snapshot, metrics, use_ai=USE_AI, deadline=None, unchanged=(), done=None):
+    sink = SnapshotSink(snapshot, metrics, use_ai, deadline, done)
+    sink.mark_unchanged(unchanged)
+    try:
+        if rows:
+            sink.write((rows, news_by_row))
+    except BaseException:
+        sink.close(complete=False)
+        raise
+    return sink.close()
+
+
+def process(fetched, snapshot, metrics, cache=None, use_ai=USE_AI, deadline=None, held_back=None, unchanged=(),
+            done=None):
+    rows, news_by_row = prepare(fetched, snapshot, metrics, cache, deadline, held_back)
+    if not rows and not unchanged:
+        return 0
+    return store(rows, news_by_row, snapshot, metrics, use_ai, deadline, unchanged, done)
+
+
+def stream_feeds(feeds, metrics, feed_state, deadline, failures):
+    # fetch_iter with the fetch stage's metrics and messages; the time spent
+    # waiting for downstream stages to take a feed is not counted.
+    feeds_seen = unchanged = 0
+    stage = metrics.stages.setdefault("fetch", {})
+    iterator = fetch_iter(feeds, state=feed_state, deadline=deadline, failures=failures)
+    try:
+        while True:
+            with metrics.stage("fetch"):
+                entry = next(iterator, None)
+            if entry is None:
+                break
+            geo, _, _, body = entry
+            feeds_seen += 1
+            unchanged += body is None and geo not in failures
+            stage["feeds"] = feeds_seen
+            stage["unchanged_feeds"] = unchanged
+            stage["bytes"] = stage.get("bytes", 0) + (len(body) if body is not None else 0)
+            yield entry
+    finally:
+        iterator.close()
+        print(f"Fetched {feeds_seen} feeds, {unchanged} unchanged since the last run", flush=True)
+        report_missing(metrics, failures)
+
+
+def run(feeds=FEEDS, use_ai=USE_AI):
+    # fetch -> parse -> normalize -> translate -> store as a pipeline of one
+    # feed per batch: translation of one geo overlaps with fetching the next,
+    # and only a few feeds are in memory at any time.
+    deadline = Deadline()
+    snapshot = new_snapshot()
+    metrics = RunMetrics(snapshot)
+    feed_state = load_feed_state()
+    previous_state = dict(feed_state)
+    failures = {}
+    held_back = {}
+    # Geos whose rows are all stored (or that had none); only their feed
+    # state moves forward. The sink commits the run's SQLite rows together,
+    # so if it does not, no geo counts as stored.
+    stored = set()
+    cache = TranslationCache()
+
+    def parse(entry):
+        geo, _, _, body = entry
+        if body is None and geo not in failures:
+            sink.mark_unchanged([geo])
+        with metrics.stage("parse") as stage:
+            unreadable = {}
+            rows, news_by_row, pub_dates = build_rows([entry], snapshot, unreadable)
+            stage["items"] = stage.get("items", 0) + len(rows)
+            stage["news_items"] = stage.get("news_items", 0) + sum(len(news) for news in news_by_row)
+        if unreadable:
+            held_back.update(unreadable)
+            report_missing(metrics, unreadable)
+            return None
+        with metrics.stage("archive") as stage:
+            stage["blobs_written"] = stage.get("blobs_written", 0) + archive_feeds([entry], snapshot)
+        if not rows:
+            stored.add(geo)
+            return None
+        return geo, rows, news_by_row, pub_dates
+
+    def normalize(batch):
+        geo, rows, news_by_row, pub_dates = batch
+        with metrics.stage("normalize"):
+            normalize_rows(rows, pub_dates)
+        return geo, rows, news_by_row
+
+    def translate(batch):
+        geo, rows, news_by_row = batch
+        with metrics.stage("translate") as stage:
+            hits, misses = cache.hits, cache.misses
+            news_by_row, unique_strings, calls, untranslated = translate_rows(rows, news_by_row, cache, deadline)
+            count_translations(stage, cache, hits, misses, unique_strings, calls)
+        if untranslated:
+            hold_back_untranslated(metrics, held_back, untranslated)
+            return None
+        return geo, rows, news_by_row
+
+    def store_batch(batch):
+        geo, rows, news_by_row = batch
+        sink.write((rows, news_by_row))
+        stored.add(geo)
+
+    fetch_deadline = deadline.reserve(FETCH_RESERVE)
+    pipeline = (
+        Pipeline(stream_feeds(feeds, metrics, feed_state, fetch_deadline, failures))
+        .then(parse)
+        .then(normalize)
+        .then(translate)
+    )
+    sink = SnapshotSink(snapshot, metrics, use_ai, deadline)
+    complete = False
+    try:
+        try:
+            pipeline.run(store_batch)
+        finally:
+            cache.close()
+        print_translations(metrics.stages.get("translate", {}))
+        complete = True
+    finally:
+        try:
+            sink.close(complete)
+        finally:
+            if "sqlite" not in sink.done:
+                stored.clear()
+            restore_feed_state(feed_state, previous_state, [geo for geo, _, _ in feeds if geo not in stored])
+            save_feed_state(feed_state)
+            metrics.write()
@@ -0,0 +1,59 @@
+import io
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+
+HT = "{https://trends.google.com/trending/rss}"
+NEWS_ITEM = HT + "news_item"
+
+FeedItem = namedtuple("FeedItem", ["title", "traffic", "pub_date", "picture", "news"])
+NewsItem = namedtuple("NewsItem", ["title", "url", "picture", "source"])
+
+
+def parse_feed(data):
+    # Single pass over the raw feed bytes: every <item> is turned into a
+    # FeedItem as soon as it closes and is then dropped from the tree.
+    channel = None
+    item = None
+    news = None
+    news_items = None
+
+    for event, elem in ET.iterparse(io.BytesIO(data), events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            if tag == "item":
+                item = {}
+                news_items = []
+            elif tag == NEWS_ITEM and item is not None:
+                news = {}
+            elif tag == "channel":
+                channel = elem
+            continue
+
+        if item is None:
+            continue
+
+        if news is not None:
+            if tag == NEWS_ITEM:
+                news_items.append(NewsItem(
+                    news.get(HT + "news_item_title"),
+                    news.get(HT + "news_item_url"),
+                    news.get(HT + "news_item_picture"),
+                    news.get(HT + "news_item_source"),
+                ))
+                news = None
+            else:
+                news[tag] = elem.text
+        elif tag == "item":
+            yield FeedItem(
+                item.get("title"),
+                item.get(HT + "approx_traffic"),
+                item.get("pubDate"),
+                item.get(HT + "picture"),
+                news_items,
+            )
+            item = None
+            elem.clear()
+            if channel is not None:
+                channel.remove(elem)
+        else:
+            item[tag] = elem.text
@@ -0,0 +1,274 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+
+# The feed registry: one {"geo", "language", "country"} object per feed.
+# It ships with the code rather than under data/, so it is found from any
+# working directory; FEEDS_CONFIG points at another registry.
+FEEDS_PATH = os.getenv(
+    "FEEDS_CONFIG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "config", "feeds.json"),
+)
+
+
+def load_feeds(path=FEEDS_PATH):
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    feeds = [(entry["geo"], entry["language"], entry["country"]) for entry in entries]
+    geos = [geo for geo, _, _ in feeds]
+    duplicates = sorted({geo for geo in geos if geos.count(geo) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate geos in {path}: {', '.join(duplicates)}")
+    return feeds
+
+
+FEEDS = load_feeds()
+
+FEED_URL = os.getenv("TRENDS_FEED_URL", "https://trends.google.com/trending/rss?geo={geo}")
+# Per-request timeouts adapt to each feed's usual response time, between
+# these bounds (seconds), and never run past the run deadline.
+FETCH_TIMEOUT = 30
+MIN_FETCH_TIMEOUT = 5
+TIMEOUT_FACTOR = 4
+
+# Failed requests are retried after a random ("full jitter") backoff, so
+# retries from parallel workers do not hit the host at the same moment.
+FETCH_RETRIES = int(os.getenv("FETCH_RETRIES", "2"))
+RETRY_BACKOFF = 1.0
+
+# Once this many different feeds of a host have failed (retries used up)
+# with no success in between, the host is skipped for BREAKER_COOLDOWN
+# seconds instead of every remaining feed waiting out its own timeout.
+BREAKER_THRESHOLD = 3
+BREAKER_COOLDOWN = 60
+
+# Validators and body hash of the last feed we processed, per geo.
+STATE_PATH = os.path.join("data", "feed_state.json")
+
+# How many feeds are downloaded at the same time (override with FETCH_CONCURRENCY).
+MAX_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "8"))
+
+
+def make_session(pool_size=MAX_CONCURRENCY):
+    # One keep-alive connection pool shared by all the worker threads.
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def load_feed_state(path=STATE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_feed_state(state, path=STATE_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def restore_feed_state(state, previous, geos):
+    # Puts the entries of `geos` back to what they were in `previous`, so
+    # feeds whose rows were not all stored are fetched in full next time.
+    for geo in geos:
+        if previous.get(geo) is None:
+            state.pop(geo, None)
+        else:
+            state[geo] = previous[geo]
+
+
+class FeedUnavailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failed_geos = set()
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                # Half open: let one trial request through; the rest keep
+                # failing fast until it reports back.
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record(self, ok, geo=None):
+        # One call per feed, not per attempt: a single broken feed retrying
+        # must not take its healthy neighbours on the same host down with it.
+        with self.lock:
+            if ok:
+                self.failed_geos.clear()
+                self.opened_at = None
+            else:
+                self.failed_geos.add(geo)
+                if len(self.failed_geos) >= self.threshold:
+                    self.opened_at = time.monotonic()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(url):
+    # One breaker per host, shared by every fetch in the process.
+    with _breakers_lock:
+        return _breakers.setdefault(urlparse(url).netloc, CircuitBreaker())
+
+
+def request_timeout(previous, deadline=None):
+    latency = previous.get("latency_s") if previous else None
+    if latency is None:
+        timeout = FETCH_TIMEOUT
+    else:
+        timeout = min(FETCH_TIMEOUT, max(MIN_FETCH_TIMEOUT, latency * TIMEOUT_FACTOR))
+    if deadline is not None:
+        timeout = min(timeout, deadline.remaining())
+    return timeout
+
+
+def fetch_feed(session, geo, feed_url=FEED_URL, state=None, deadline=None, retries=FETCH_RETRIES):
+    # Raw bytes: the parser handles the XML encoding itself.
+    # With a `state` dict the request is conditional, and None is returned
+    # when the feed is the same document we processed last time.
+    # Raises FeedUnavailable once retries, the breaker or the deadline give up.
+    previous = state.get(geo) if state is not None else None
+    headers = {}
+    if previous:
+        if previous.get("etag"):
+            headers["If-None-Match"] = previous["etag"]
+        if previous.get("last_modified"):
+            headers["If-Modified-Since"] = previous["last_modified"]
+
+    url = feed_url.format(geo=geo)
+    breaker = breaker_for(url)
+    error = None
+    for attempt in range(retries + 1):
+        if deadline is not None and deadline.expired():
+            raise FeedUnavailable(f"run deadline reached ({error or 'not fetched'})")
+        if not breaker.allow():
+            raise FeedUnavailable(f"circuit open for {urlparse(url).netloc} ({error or 'host failing'})")
+
+        started = time.monotonic()
+        try:
+            response = session.get(url, headers=headers, timeout=request_timeout(previous, deadline))
+            if response.status_code == 429 or response.status_code >= 500:
+                raise FeedUnavailable(f"HTTP {response.status_code}")
+        except (requests.RequestException, FeedUnavailable) as e:
+            error = e
+            if attempt < retries:
+                delay = random.uniform(0, RETRY_BACKOFF * 2 ** attempt)
+                if deadline is not None:
+                    delay = min(delay, deadline.remaining())
+                time.sleep(delay)
+            continue
+        breaker.record(True)
+        break
+    else:
+        breaker.record(False, geo)
+        raise FeedUnavailable(f"{retries + 1} attempts failed, last: {error}")
+
+    # Smoothed response time, the base for this feed's next timeout.
+    latency = time.monotonic() - started
+    if previous and previous.get("latency_s") is not None:
+        latency = 0.7 * previous["latency_s"] + 0.3 * latency
+    latency = round(latency, 3)
+
+    if response.status_code == 304:
+        if previous is not None:
+            previous["latency_s"] = latency
+        return None
+    if response.status_code >= 400:
+        raise FeedUnavailable(f"HTTP {response.status_code}")
+
+    body = response.content
+    if state is not None:
+        digest = hashlib.sha256(body).hexdigest()
+        state[geo] = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "sha256": digest,
+            "latency_s": latency,
+        }
+        if previous and previous.get("sha256") == digest:
+            return None
+    return body
+
+
+def fetch_iter(feeds, max_concurrency=MAX_CONCURRENCY, session=None, feed_url=FEED_URL, state=None,
+               deadline=None, failures=None):
+    # Yields (geo, lang, country, body) in the same order as `feeds`, so the
+    # output CSV does not depend on which feed answered first, with at most
+    # `max_concurrency` requests ahead of the consumer: a slow consumer holds
+    # the downloads back instead of every body being buffered.
+    # body is None for feeds that did not change since `state` was saved,
+    # and for feeds that could not be fetched before `deadline`; those are
+    # listed in `failures` ({geo: reason}) and keep their old state, so the
+    # next run fetches them again.
+    own_session = session is None
+    if own_session:
+        session = make_session(max_concurrency)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(feeds))))
+    remaining = iter(feeds)
+    in_flight = deque()
+
+    def submit_next():
+        for feed in remaining:
+            geo = feed[0]
+            # Each fetch works on its own copy of the state: a request still
+            # running when the deadline passes must not mark its feed as processed.
+            feed_state = {geo: dict(state[geo])} if state is not None and geo in state else {}
+            future = pool.submit(fetch_feed, session, geo, feed_url, feed_state if state is not None else None, deadline)
+            in_flight.append((feed, future, feed_state))
+            return
+
+    try:
+        for _ in range(max_concurrency):
+            submit_next()
+        while in_flight:
+            (geo, lang, country), future, feed_state = in_flight.popleft()
+            body = None
+            try:
+                body = future.result(timeout=deadline.remaining() if deadline is not None else None)
+                if state is not None:
+                    state.update(feed_state)
+            except FutureTimeoutError:
+                if failures is not None:
+                    failures[geo] = "run deadline reached"
+            except Exception as e:
+                if failures is not None:
+                    failures[geo] = str(e)
+            submit_next()
+            yield geo, lang, country, body
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        if own_session:
+            session.close()
+
+
+def fetch_all(feeds, max_concurrency=MAX_CONCURRENCY, session=None, feed_url=FEED_URL, state=None,
+              deadline=None, failures=None):
+    # fetch_iter collected into a list, for callers that want every feed at once.
+    return list(fetch_iter(feeds, max_concurrency, session, feed_url, state, deadline, failures))
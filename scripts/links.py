@@ -0,0 +1,238 @@
+import argparse
+import array
+import csv
+import hashlib
+import os
+import re
+from urllib.parse import quote, unquote, unquote_to_bytes, urlsplit, urlunsplit
+
+from row_index import INDEX_SUFFIX, RowIndex
+
+# Content-addressed link table: every news, picture and news picture URL is
+# canonicalized and stored once as "<link_id>,<url>"; snapshot rows (CSV and
+# Parquet) hold the 16-character link_id instead of the URL. The id is a hash
+# of the canonical URL, so the same link gets the same id in every run, shard
+# and replay without any coordination, and a line appended twice is harmless.
+LINKS_PATH = os.path.join("data", "links.csv")
+SNAPSHOT_PATH = os.path.join("data", "trending_now_snapshot.csv")
+
+LINK_COLUMNS = ["picture_url"] + [
+    f"news_item_{kind}_{i}" for i in range(1, 4) for kind in ("url", "picture")
+]
+NEWS_URL_COLUMNS = [f"news_item_url_{i}" for i in range(1, 4)]
+
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "gbraid", "wbraid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid",
+    "ocid", "cmpid", "_ga", "_gl", "spm", "ito", "at_medium", "at_campaign",
+}
+TRACKING_PREFIXES = ("utm_",)
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+# RFC 3986 unreserved characters: escaping them never changes a URL's meaning.
+UNRESERVED = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+ID_LENGTH = 16
+
+_ESCAPES = re.compile(r"(?:%[0-9A-Fa-f]{2})+")
+_LINK_ID = re.compile(r"[0-9a-f]{%d}" % ID_LENGTH)
+
+
+def _decode_escapes(match):
+    # Percent-escapes of UTF-8 text (the Arabic, Hebrew... article paths) and
+    # of unreserved characters are decoded; escaped delimiters stay escaped.
+    escaped = match.group()
+    try:
+        text = unquote_to_bytes(escaped).decode("utf-8")
+    except UnicodeDecodeError:
+        return escaped.upper()
+    return "".join(c if ord(c) > 127 or c in UNRESERVED else quote(c, safe="") for c in text)
+
+
+def _is_tracking(param):
+    name = unquote(param.split("=", 1)[0]).lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def canonicalize(url):
+    # Lower-case scheme and host, no default port or fragment, tracking
+    # parameters dropped, readable path and query. Anything that is not an
+    # absolute http(s) URL is only stripped of surrounding whitespace.
+    url = url.strip()
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.netloc:
+        return url
+    host = parts.hostname or ""
+    if parts.port is not None and str(parts.port) != DEFAULT_PORTS[scheme]:
+        host = f"{host}:{parts.port}"
+    query = "&".join(param for param in parts.query.split("&") if param and not _is_tracking(param))
+    return urlunsplit((
+        scheme,
+        host,
+        _ESCAPES.sub(_decode_escapes, parts.path) or "/",
+        _ESCAPES.sub(_decode_escapes, query),
+        "",
+    ))
+
+
+def link_id(canonical_url):
+    return hashlib.blake2b(canonical_url.encode("utf-8"), digest_size=ID_LENGTH // 2).hexdigest()
+
+
+def is_link_id(value):
+    return bool(value) and _LINK_ID.fullmatch(value) is not None
+
+
+class LinkTable:
+    # Which ids are already in the table is answered from a digest index
+    # next to the file (the row_index.py format), so a run does not read
+    # the whole table back; a missing or stale index is rebuilt once.
+    # Links seen for the first time are appended by flush(); close() saves
+    # the index.
+    def __init__(self, path=LINKS_PATH):
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        self.index = None
+        self.pending = {}
+
+    def _load(self):
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        self.index = RowIndex.load(self.index_path, size) if size else RowIndex()
+        if self.index is None:
+            with open(self.path, newline="", encoding="utf-8") as f:
+                digests = {int(row["link_id"], 16) for row in csv.DictReader(f)}
+            self.index = RowIndex(array.array("Q", sorted(digests)))
+
+    def intern(self, url):
+        # Returns the id of `url`; empty values and values that already are
+        # ids (a row stored before) are returned unchanged.
+        if not url or is_link_id(url):
+            return url
+        if self.index is None:
+            self._load()
+        canonical = canonicalize(url)
+        key = link_id(canonical)
+        digest = int(key, 16)
+        if digest not in self.index:
+            self.index.add(digest)
+            self.pending[key] = canonical
+        return key
+
+    def flush(self):
+        if not self.pending:
+            return 0
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        new_file = not os.path.exists(self.path)
+        with open(self.path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(["link_id", "url"])
+            writer.writerows(self.pending.items())
+        added = len(self.pending)
+        self.pending = {}
+        return added
+
+    def close(self):
+        self.flush()
+        if self.index is not None and os.path.exists(self.path):
+            self.index.save(self.index_path, os.path.getsize(self.path))
+
+
+def intern_rows(rows, table, columns=LINK_COLUMNS):
+    # Copies of `rows` with their link columns replaced by link ids.
+    interned = []
+    for row in rows:
+        row = dict(row)
+        for col in columns:
+            if col in row:
+                row[col] = table.intern(row[col])
+        interned.append(row)
+    return interned
+
+
+def load_links(path=LINKS_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, newline="", encoding="utf-8") as f:
+        return {row["link_id"]: row["url"] for row in csv.DictReader(f)}
+
+
+def resolve(value, links):
+    # A stored link column back to its URL; rows written before the link
+    # table existed still hold the raw URL and are returned as they are.
+    return links.get(value, value) if is_link_id(value) else value
+
+
+def shared_articles(csv_path=SNAPSHOT_PATH, min_countries=2, start=None, end=None):
+    # [(link id, set of countries)] of the news articles listed under trends
+    # of at least `min_countries` countries, most widespread first.
+    countries = {}
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            if start and row["snapshot"][:10] < start:
+                continue
+            if end and row["snapshot"][:10] > end:
+                continue
+            for col in NEWS_URL_COLUMNS:
+                value = row.get(col)
+                if value:
+                    key = value if is_link_id(value) else link_id(canonicalize(value))
+                    countries.setdefault(key, set()).add(row["country"])
+    shared = [(key, seen) for key, seen in countries.items() if len(seen) >= min_countries]
+    shared.sort(key=lambda item: (-len(item[1]), item[0]))
+    return shared
+
+
+def migrate(csv_path=SNAPSHOT_PATH, table=None):
+    # Rewrites a snapshot CSV written before the link table existed with link
+    # ids in place of URLs. Its row index no longer matches and is removed,
+    # so the next run rebuilds it.
+    table = table or LinkTable()
+    tmp_path = csv_path + ".tmp"
+    rows = 0
+    with open(csv_path, newline="", encoding="utf-8-sig") as src, \
+            open(tmp_path, "w", newline="", encoding="utf-8-sig") as dst:
+        reader = csv.DictReader(src)
+        writer = csv.DictWriter(dst, fieldnames=reader.fieldnames)
+        writer.writeheader()
+        for row in reader:
+            for col in LINK_COLUMNS:
+                if col in row:
+                    row[col] = table.intern(row[col])
+            writer.writerow(row)
+            rows += 1
+    added = table.flush()
+    table.close()
+    os.replace(tmp_path, csv_path)
+    if os.path.exists(csv_path + INDEX_SUFFIX):
+        os.remove(csv_path + INDEX_SUFFIX)
+    return rows, added
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="The link table: look up links, find shared articles, migrate.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    resolve_parser = sub.add_parser("resolve", help="print the URL of link ids")
+    resolve_parser.add_argument("ids", nargs="+")
+    shared_parser = sub.add_parser("shared", help="articles trending in several countries")
+    shared_parser.add_argument("--min-countries", type=int, default=2)
+    shared_parser.add_argument("--start", help="first snapshot date (YYYY-MM-DD)")
+    shared_parser.add_argument("--end", help="last snapshot date (YYYY-MM-DD)")
+    shared_parser.add_argument("--top", type=int, default=20)
+    migrate_parser = sub.add_parser("migrate", help="replace the URLs of an existing snapshot CSV by link ids")
+    for p in (shared_parser, migrate_parser):
+        p.add_argument("--csv", default=SNAPSHOT_PATH)
+    for p in (resolve_parser, shared_parser, migrate_parser):
+        p.add_argument("--links", default=LINKS_PATH)
+    args = parser.parse_args()
+
+    if args.command == "resolve":
+        links = load_links(args.links)
+        for value in args.ids:
+            print(f"{value}  {links.get(value, '(unknown)')}", flush=True)
+    elif args.command == "shared":
+        links = load_links(args.links)
+        for key, countries in shared_articles(args.csv, args.min_countries, args.start, args.end)[:args.top]:
+            print(f"{len(countries):>3}  {key}  {links.get(key, '(unknown)')}  {', '.join(sorted(countries))}",
+                  flush=True)
+    else:
+        rows, added = migrate(args.csv, LinkTable(args.links))
+        print(f"Migrated {rows} rows of {args.csv}, {added} new links in {args.links}", flush=True)
@@ -0,0 +1,199 @@
+import argparse
+import csv
+import glob
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from fetch_feeds import FEEDS
+from normalize import normalize_batch
+from links import LINKS_PATH, SNAPSHOT_PATH, load_links
+from sqlite_store import DB_PATH, connect, import_links, write_run
+from trend_lifetime import rebuild as rebuild_lifetimes
+
+LEGACY_GLOB = os.path.join("data", "old_data", "trending_now_snapshot*.csv")
+CHUNK_SIZE = 5000
+
+COUNTRY_FEEDS = {country: (geo, lang) for geo, lang, country in FEEDS}
+NEWS_SLOTS = 3
+
+
+def parse_timestamp(value):
+    # The snapshots mix ISO 8601 (v1-v3 pulled_at_utc), RFC 822 (RSS pubDate)
+    # and dd/mm/yyyy[ HH:MM] (v4's first file). Naive values are taken as UTC.
+    value = (value or "").strip()
+    if not value:
+        return None
+    for parse in (
+        datetime.fromisoformat,
+        parsedate_to_datetime,
+        lambda v: datetime.strptime(v, "%d/%m/%Y %H:%M"),
+        lambda v: datetime.strptime(v, "%d/%m/%Y"),
+    ):
+        try:
+            dt = parse(value)
+        except (TypeError, ValueError):
+            continue
+        return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+    return None
+
+
+def format_snapshot(value):
+    dt = parse_timestamp(value)
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S") if dt else value
+
+
+def format_date(value):
+    dt = parse_timestamp(value)
+    return dt.strftime("%Y-%m-%d") if dt else value
+
+
+def detect_schema(fieldnames):
+    fields = set(fieldnames or [])
+    if "news_item_title_1" in fields:
+        return "wide"
+    if {"pulled_at_utc", "country_en", "title_original"} <= fields:
+        return "legacy"
+    return None
+
+
+def convert_legacy(rows):
+    # v1 / v2 / v3: one trend per row, no news items; summary_hebrew (v2+) and
+    # search_volume (v3) may be missing. Traffic and pubDates are normalized
+    # for the whole chunk at once.
+    normalized = normalize_batch(
+        [row.get("search_volume") for row in rows],
+        [row.get("published") for row in rows],
+    )
+    normalized = normalized.astype(object).where(normalized.notna(), None)
+
+    converted = []
+    for row, norm in zip(rows, normalized.itertuples(index=False)):
+        geo, lang = COUNTRY_FEEDS.get(row["country_en"], (None, None))
+        record = {
+            "geo": geo or row["country_en"],
+            "language": lang,
+            "country": row["country_en"],
+            "trend_title": row.get("title_english") or row["title_original"],
+            "original_title": row["title_original"],
+            "summary": row.get("summary_hebrew") or None,
+            "traffic": norm.traffic,
+            "date": norm.date,
+            "start_time": norm.start_time,
+            "end_time": norm.end_time,
+            "picture_url": None,
+        }
+        converted.append((format_snapshot(row["pulled_at_utc"]), record, []))
+    return converted
+
+
+def convert_wide(rows):
+    return [_convert_wide_row(row) for row in rows]
+
+
+def _convert_wide_row(row):
+    record = {key: (value or None) for key, value in row.items()}
+    record["date"] = format_date(row.get("date"))
+    record["traffic"] = int(float(row["traffic"])) if row.get("traffic") else None
+    news = [
+        (
+            row.get(f"news_item_title_{i}") or None,
+            row.get(f"news_item_url_{i}") or None,
+            row.get(f"news_item_picture_{i}") or None,
+            row.get(f"news_item_source_{i}") or None,
+        )
+        for i in range(1, NEWS_SLOTS + 1)
+    ]
+    return format_snapshot(row["snapshot"]), record, [n for n in news if any(n)]
+
+
+def _flush(conn, chunk):
+    by_snapshot = {}
+    for snapshot, record, news in chunk:
+        records, news_lists = by_snapshot.setdefault(snapshot, ([], []))
+        records.append(record)
+        news_lists.append(news)
+    for snapshot, (records, news_lists) in by_snapshot.items():
+        write_run(conn, snapshot, records, news_lists, commit=False)
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def migrate_file(conn, path, chunk_size=CHUNK_SIZE):
+    digest = file_digest(path)
+    if conn.execute("SELECT 1 FROM migrations WHERE sha256 = ?", (digest,)).fetchone():
+        return "already migrated", 0
+
+    # One transaction for the whole file, `migrations` row included: a run
+    # that fails partway leaves nothing behind and the rerun starts clean.
+    with conn, open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        schema = detect_schema(reader.fieldnames)
+        if schema is None:
+            return "unknown schema", 0
+        convert = convert_wide if schema == "wide" else convert_legacy
+
+        migrated = 0
+        chunk = []
+        for row in reader:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                _flush(conn, convert(chunk))
+                migrated += len(chunk)
+                chunk = []
+        if chunk:
+            _flush(conn, convert(chunk))
+            migrated += len(chunk)
+
+        conn.execute("INSERT INTO migrations (path, sha256, schema, rows) VALUES (?, ?, ?, ?)",
+                     (path, digest, schema, migrated))
+    return schema, migrated
+
+
+def restore_store(db_path=DB_PATH, csv_path=SNAPSHOT_PATH, links_path=LINKS_PATH):
+    # trends.sqlite is not committed; when it is missing (a cold cache) but
+    # the snapshot CSV is there, it is rebuilt from the CSV and the link
+    # table before the run adds to it, instead of starting empty, and so
+    # are the lifetimes and rollups derived from it.
+    if os.path.exists(db_path) or not os.path.exists(csv_path):
+        return None
+    conn = connect(db_path)
+    try:
+        import_links(conn, load_links(links_path))
+        schema, rows = migrate_file(conn, csv_path)
+        snapshots = rebuild_lifetimes(conn)
+    except BaseException:
+        conn.close()
+        os.remove(db_path)
+        raise
+    conn.close()
+    # Rollups pull in numpy; only load it when there is something to rebuild.
+    from rollups import rebuild as rebuild_rollups
+
+    rebuild_rollups(db_path)
+    print(f"Rebuilt {db_path} from {csv_path}: {rows} rows, {snapshots} snapshots", flush=True)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load legacy snapshot CSVs into the SQLite store.")
+    parser.add_argument("files", nargs="*", help=f"CSV files (default: {LEGACY_GLOB})")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--links", default=LINKS_PATH, help="link table the CSVs' link ids refer to")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    # Snapshot CSVs written since the link table hold ids, not URLs.
+    print(f"{args.links}: {import_links(conn, load_links(args.links))} links", flush=True)
+    for path in args.files or sorted(glob.glob(LEGACY_GLOB)):
+        schema, rows = migrate_file(conn, path, args.chunk_size)
+        print(f"{path}: {schema}, {rows} rows", flush=True)
+    conn.close()
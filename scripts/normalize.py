@@ -0,0 +1,114 @@
+import math
+import re
+from datetime import datetime, timezone
+from functools import lru_cache
+
+PUB_DATE_FORMAT = "%a, %d %b %Y %H:%M:%S %z"
+TRAFFIC_MULTIPLIERS = {"K": 1_000, "M": 1_000_000}
+
+_TRAFFIC_NOISE = re.compile(r"[+,\s]")
+
+# The extractor normalizes its few hundred rows per run with the plain
+# functions below; the pandas versions further down are for the bulk
+# migration of legacy files, and import pandas only when called.
+
+
+def normalize_title(title):
+    # Key for "the same trend": case and whitespace differences don't count.
+    return " ".join(str(title).lower().split())
+
+
+def parse_traffic(raw):
+    # "200+", "2K+", "1.5M+", "1,000+" -> int, or None
+    if raw is None:
+        return None
+    s = _TRAFFIC_NOISE.sub("", str(raw))
+    multiplier = TRAFFIC_MULTIPLIERS.get(s[-1:], 1)
+    try:
+        number = float(s.rstrip("KM"))
+    except ValueError:
+        return None
+    if not math.isfinite(number):
+        return None
+    return round(number * multiplier)
+
+
+@lru_cache(maxsize=4096)
+def parse_pub_date(raw):
+    # -> (published, date, start_time, end_time) with published in UTC;
+    # all four are None for a missing or unparseable pubDate. Feeds repeat
+    # the same few hour marks, so each distinct value is parsed once.
+    try:
+        published = datetime.strptime(raw, PUB_DATE_FORMAT)
+    except (TypeError, ValueError):
+        return None, None, None, None
+    # start_time is the UTC offset the way the snapshot CSV has always had
+    # it: "+03:00:00" for +0300 but "07:00:00" for -0700 (v4 dropped a minus).
+    offset = published.strftime("%z")
+    local = published.replace(tzinfo=None)
+    return (
+        published.astimezone(timezone.utc),
+        local.strftime("%Y-%m-%d"),
+        f"{offset[:3].replace('-', '')}:{offset[3:]}:00",
+        local.strftime("%H:%M:%S"),
+    )
+
+
+def normalize_rows(rows, pub_dates):
+    # Fills traffic, date, start_time and end_time of the extractor's row
+    # dicts in place, with the same values normalize_batch produces.
+    for row, raw in zip(rows, pub_dates):
+        row["traffic"] = parse_traffic(row["traffic"])
+        _, row["date"], row["start_time"], row["end_time"] = parse_pub_date(raw)
+    return rows
+
+
+def normalize_traffic(raw):
+    # "200+", "2K+", "1.5M+", "1,000+" -> nullable int
+    import pandas as pd
+
+    s = pd.Series(raw, dtype="string").str.replace(r"[+,\s]", "", regex=True)
+    suffix = s.str[-1:]
+    multiplier = suffix.map(TRAFFIC_MULTIPLIERS).fillna(1).astype("float64")
+    number = pd.to_numeric(s.str.rstrip("KM"), errors="coerce")
+    # "inf" and "nan" parse as numbers; like parse_traffic, they are no value.
+    number = number.mask(number.isin([float("inf"), float("-inf")]) | number.isna())
+    return (number * multiplier).round().astype("Int64")
+
+
+def normalize_pub_dates(raw):
+    # Every distinct pubDate is parsed once (feeds repeat the same few hour
+    # marks), then the results are spread back by position.
+    import pandas as pd
+
+    codes, uniques = pd.factorize(pd.Series(raw, dtype="object"))
+    # Missing pubDates (code -1) pick the empty value appended last, which
+    # also covers a batch without a single pubDate.
+    uniques = pd.Series([*uniques, None], dtype="string")
+
+    published = pd.to_datetime(uniques, format=PUB_DATE_FORMAT, utc=True, errors="coerce")
+    offset = uniques.str.extract(r"([+-])(\d{2})(\d{2})$")
+    sign = offset[0].map({"+": 1, "-": -1})
+    minutes = sign * (offset[1].astype("float64") * 60 + offset[2].astype("float64"))
+    local = published.dt.tz_localize(None) + pd.to_timedelta(minutes, unit="m")
+
+    parts = pd.DataFrame({
+        "published": published,
+        "date": local.dt.strftime("%Y-%m-%d"),
+        # The UTC offset as parse_pub_date writes it, "+03:00:00" / "07:00:00".
+        "start_time": offset[0].str.replace("-", "") + offset[1] + ":" + offset[2] + ":00",
+        "end_time": local.dt.strftime("%H:%M:%S"),
+    })
+    # Missing or unparseable dates stay empty in every column.
+    parts.loc[published.isna(), ["date", "start_time", "end_time"]] = None
+
+    return parts.iloc[codes].reset_index(drop=True)
+
+
+def normalize_batch(traffic_raw, pub_date_raw):
+    # Typed columns for a whole batch of raw feed items:
+    # traffic (Int64), published (UTC timestamp) and the date / start_time /
+    # end_time strings the snapshot CSV has always used.
+    out = normalize_pub_dates(pub_date_raw)
+    out.insert(0, "traffic", normalize_traffic(traffic_raw).reset_index(drop=True))
+    return out
@@ -0,0 +1,116 @@
+import argparse
+import glob
+import os
+
+ARCHIVE_DIR = os.path.join("data", "parquet")
+
+# Low-cardinality columns stored dictionary encoded.
+DICTIONARY_COLUMNS = [
+    "country", "language",
+    "news_item_source_1", "news_item_source_2", "news_item_source_3",
+]
+INT_COLUMNS = ["traffic"]
+
+# `date` already holds the trend's own date, so the run date partition is
+# called snapshot_date. Both partition values live in the path, not the file.
+PARTITION_COLUMNS = ["snapshot_date", "geo"]
+
+
+def _schema(columns):
+    import pyarrow as pa
+
+    fields = []
+    for col in columns:
+        if col in INT_COLUMNS:
+            fields.append(pa.field(col, pa.int64()))
+        elif col in DICTIONARY_COLUMNS:
+            fields.append(pa.field(col, pa.dictionary(pa.int32(), pa.string())))
+        else:
+            fields.append(pa.field(col, pa.string()))
+    return pa.schema(fields)
+
+
+def write_segment(rows, root=ARCHIVE_DIR):
+    # One file per (snapshot_date, geo) for this run's row dicts:
+    # data/parquet/snapshot_date=YYYY-MM-DD/geo=XX/part-<snapshot>.parquet
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if not rows:
+        return []
+    columns = [col for col in rows[0] if col not in PARTITION_COLUMNS]
+    schema = _schema(columns)
+
+    partitions = {}
+    for row in rows:
+        partitions.setdefault((row["snapshot"][:10], row["geo"]), []).append(row)
+
+    paths = []
+    for (snapshot_date, geo), part in partitions.items():
+        part_dir = os.path.join(root, f"snapshot_date={snapshot_date}", f"geo={geo}")
+        os.makedirs(part_dir, exist_ok=True)
+        stamp = part[0]["snapshot"].replace("-", "").replace(":", "").replace(" ", "T")
+        path = os.path.join(part_dir, f"part-{stamp}.parquet")
+        table = pa.Table.from_pylist(part, schema=schema)
+        pq.write_table(table, path, use_dictionary=DICTIONARY_COLUMNS, compression="zstd")
+        paths.append(path)
+    return paths
+
+
+def compact(root=ARCHIVE_DIR, snapshot_date=None):
+    # Merges the small per-run files of each partition into a single file.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    pattern = os.path.join(root, f"snapshot_date={snapshot_date or '*'}", "geo=*")
+    compacted = 0
+    for part_dir in sorted(glob.glob(pattern)):
+        files = sorted(glob.glob(os.path.join(part_dir, "*.parquet")))
+        if len(files) < 2:
+            continue
+        table = pa.concat_tables([pq.read_table(f) for f in files], promote_options="default")
+        table = table.sort_by("snapshot")
+        # Readers skip "_"-prefixed files, so a half-written file is never seen.
+        tmp_path = os.path.join(part_dir, "_compacted.parquet.tmp")
+        final_path = os.path.join(part_dir, "part-compacted.parquet")
+        pq.write_table(table, tmp_path, use_dictionary=DICTIONARY_COLUMNS, compression="zstd")
+        os.replace(tmp_path, final_path)
+        for f in files:
+            if f != final_path:
+                os.remove(f)
+        compacted += len(files)
+    return compacted
+
+
+def read(root=ARCHIVE_DIR, geos=None, start=None, end=None, columns=None):
+    # Partitions outside the requested geos / snapshot date range are never
+    # opened, and only the requested columns are decoded.
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    partitioning = ds.partitioning(pa.schema([(col, pa.string()) for col in PARTITION_COLUMNS]), flavor="hive")
+    dataset = ds.dataset(root, format="parquet", partitioning=partitioning)
+    conditions = []
+    if geos:
+        conditions.append(ds.field("geo").isin(list(geos)))
+    if start:
+        conditions.append(ds.field("snapshot_date") >= start)
+    if end:
+        conditions.append(ds.field("snapshot_date") <= end)
+    expr = None
+    for condition in conditions:
+        expr = condition if expr is None else expr & condition
+    return dataset.to_table(columns=columns, filter=expr).to_pandas()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the partitioned Parquet archive.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    compact_parser = sub.add_parser("compact", help="merge each partition's run files into one")
+    compact_parser.add_argument("--date", help="only compact this snapshot date (YYYY-MM-DD)")
+    compact_parser.add_argument("--root", default=ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    if args.command == "compact":
+        merged = compact(args.root, args.date)
+        print(f"Compacted {merged} segment files under {os.path.abspath(args.root)}", flush=True)
@@ -0,0 +1,111 @@
+import os
+import queue
+import threading
+
+# Batches waiting between two stages. A full queue blocks the stage before
+# it, so a slow stage holds back the ones upstream instead of letting
+# batches pile up in memory.
+QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "2"))
+
+_DONE = object()
+
+
+class _Stopped(Exception):
+    pass
+
+
+class Pipeline:
+    # source -> stage -> stage ... -> sink, each stage on its own thread.
+    # A stage function takes one batch and returns the next one, or None to
+    # drop it. Batches keep their source order end to end.
+    def __init__(self, source, queue_size=QUEUE_SIZE):
+        self.source = source
+        self.queue_size = queue_size
+        self.stages = []
+        self.stop = threading.Event()
+        self.errors = []
+
+    def then(self, fn):
+        self.stages.append(fn)
+        return self
+
+    def _put(self, q, item):
+        while True:
+            if self.stop.is_set():
+                raise _Stopped()
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q):
+        while True:
+            if self.stop.is_set():
+                raise _Stopped()
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def _feed(self, out):
+        try:
+            for item in self.source:
+                self._put(out, item)
+            self._put(out, _DONE)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            self.errors.append(e)
+            self.stop.set()
+        finally:
+            # Lets a generator source release what it holds (pools, sessions).
+            close = getattr(self.source, "close", None)
+            if close is not None:
+                close()
+
+    def _work(self, fn, inbox, out):
+        try:
+            while True:
+                item = self._get(inbox)
+                if item is _DONE:
+                    self._put(out, _DONE)
+                    return
+                result = fn(item)
+                if result is not None:
+                    self._put(out, result)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            self.errors.append(e)
+            self.stop.set()
+
+    def run(self, sink):
+        # `sink` is called on the calling thread for every batch that made it
+        # through all stages. The first error in any stage stops the others
+        # and is raised here.
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._feed, args=(queues[0],), daemon=True)]
+        threads += [
+            threading.Thread(target=self._work, args=(fn, queues[i], queues[i + 1]), daemon=True)
+            for i, fn in enumerate(self.stages)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = self._get(queues[-1])
+                if item is _DONE:
+                    break
+                sink(item)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            self.errors.append(e)
+            self.stop.set()
+        finally:
+            for thread in threads:
+                thread.join()
+        if self.errors:
+            raise self.errors[0]
@@ -0,0 +1,147 @@
+import argparse
+import heapq
+import os
+import time
+from collections import deque
+
+from extractor import fetch, new_snapshot, process
+from fetch_feeds import FEEDS, load_feed_state, make_session, restore_feed_state, save_feed_state
+from run_metrics import RunMetrics
+from translation_cache import TranslationCache
+
+# Each geo is polled somewhere between these bounds (seconds): feeds that
+# changed on most recent polls move towards the minimum, quiet ones towards
+# the maximum.
+MIN_INTERVAL = int(os.getenv("POLL_MIN_INTERVAL", "900"))
+MAX_INTERVAL = int(os.getenv("POLL_MAX_INTERVAL", "10800"))
+# Fetched feeds are buffered and processed together this often.
+FLUSH_INTERVAL = int(os.getenv("POLL_FLUSH_INTERVAL", "600"))
+# How many recent polls per geo the change rate is computed over.
+HISTORY = 8
+# A buffered snapshot that fails to process is retried on this many flushes
+# before it is dropped (its feeds are then fetched in full again).
+FLUSH_ATTEMPTS = 3
+
+
+class GeoSchedule:
+    def __init__(self, feeds, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.feeds = {feed[0]: feed for feed in feeds}
+        self.changes = {geo: deque(maxlen=HISTORY) for geo in self.feeds}
+        now = time.monotonic()
+        # Start with every geo due now; the first polls spread them out.
+        self.heap = [(now, geo) for geo in self.feeds]
+        heapq.heapify(self.heap)
+
+    def interval(self, geo):
+        history = self.changes[geo]
+        # Unknown geos start in the middle of the range.
+        rate = sum(history) / len(history) if history else 0.5
+        return self.max_interval - (self.max_interval - self.min_interval) * rate
+
+    def due(self, now):
+        feeds = []
+        while self.heap and self.heap[0][0] <= now:
+            _, geo = heapq.heappop(self.heap)
+            feeds.append(self.feeds[geo])
+        return feeds
+
+    def record(self, geo, changed, now):
+        self.changes[geo].append(1 if changed else 0)
+        heapq.heappush(self.heap, (now + self.interval(geo), geo))
+
+    def retry(self, geo, now):
+        # A failed fetch says nothing about how often the feed changes.
+        heapq.heappush(self.heap, (now + self.interval(geo), geo))
+
+    def next_due(self):
+        return self.heap[0][0] if self.heap else None
+
+
+def poll(feeds=FEEDS, flush_interval=FLUSH_INTERVAL, min_interval=MIN_INTERVAL,
+         max_interval=MAX_INTERVAL, max_polls=None):
+    # Keeps one HTTP session and the translation cache open for the life of
+    # the process; each flush runs the normal pipeline on what was buffered.
+    session = make_session()
+    cache = TranslationCache()
+    feed_state = load_feed_state()
+    schedule = GeoSchedule(feeds, min_interval, max_interval)
+    buffered = []
+    metrics = None
+    last_flush = time.monotonic()
+    polls = 0
+
+    def flush():
+        # A snapshot that fails stays buffered for the next flush, and its
+        # feeds keep their old state until it is stored. The retry skips the
+        # steps that already went through (`done`, see SnapshotSink), so a
+        # snapshot committed to SQLite is not inserted again.
+        nonlocal buffered, metrics
+        kept = []
+        if buffered and metrics is None:
+            metrics = RunMetrics(buffered[0][0])
+        for snapshot, fetched, previous, unchanged, attempts, done in buffered:
+            held_back = {}
+            try:
+                process(fetched, snapshot, metrics, cache=cache, held_back=held_back, unchanged=unchanged, done=done)
+            except Exception as e:
+                restore_feed_state(feed_state, previous, previous)
+                if attempts + 1 < FLUSH_ATTEMPTS:
+                    print(f"⚠️ Processing snapshot {snapshot} failed, retrying on the next flush: {e}", flush=True)
+                    kept.append((snapshot, fetched, previous, unchanged, attempts + 1, done))
+                else:
+                    print(f"⚠️ Processing snapshot {snapshot} failed {FLUSH_ATTEMPTS} times, dropping it: {e}",
+                          flush=True)
+                continue
+            restore_feed_state(feed_state, previous, held_back)
+        save_feed_state(feed_state)
+        if metrics is not None:
+            metrics.write()
+        buffered, metrics = kept, None
+
+    try:
+        while max_polls is None or polls < max_polls:
+            now = time.monotonic()
+            due = schedule.due(now)
+            if due:
+                snapshot = new_snapshot()
+                metrics = metrics or RunMetrics(snapshot)
+                previous = {geo: feed_state.get(geo) for geo, _, _ in due}
+                failures = {}
+                fetched = fetch(due, metrics, feed_state, session=session, failures=failures)
+                for geo, _, _, body in fetched:
+                    if geo in failures:
+                        schedule.retry(geo, time.monotonic())
+                    else:
+                        schedule.record(geo, body is not None, time.monotonic())
+                changed = [entry for entry in fetched if entry[3] is not None]
+                unchanged = [geo for geo, _, _, body in fetched if body is None and geo not in failures]
+                if changed or unchanged:
+                    buffered.append((snapshot, changed, previous, unchanged, 0, set()))
+                polls += 1
+
+            if time.monotonic() - last_flush >= flush_interval:
+                flush()
+                last_flush = time.monotonic()
+
+            next_due = schedule.next_due()
+            wake = min(next_due, last_flush + flush_interval) if next_due else last_flush + flush_interval
+            time.sleep(max(0.0, min(wake - time.monotonic(), flush_interval)))
+    except KeyboardInterrupt:
+        print("Stopping poller...", flush=True)
+    finally:
+        flush()
+        cache.close()
+        session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Poll trend feeds continuously with per-geo intervals.")
+    parser.add_argument("--min-interval", type=int, default=MIN_INTERVAL, help="seconds")
+    parser.add_argument("--max-interval", type=int, default=MAX_INTERVAL, help="seconds")
+    parser.add_argument("--flush-interval", type=int, default=FLUSH_INTERVAL, help="seconds")
+    parser.add_argument("--max-polls", type=int, help="stop after this many poll rounds")
+    args = parser.parse_args()
+
+    poll(FEEDS, args.flush_interval, args.min_interval, args.max_interval, args.max_polls)
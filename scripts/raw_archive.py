@@ -0,0 +1,180 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from fetch_feeds import FEEDS
+
+# Every changed feed body is kept as a gzip blob named after its sha256
+# (identical bodies are stored once), and each fetch adds one manifest line.
+ARCHIVE_DIR = os.path.join("data", "raw")
+MANIFEST_NAME = "manifest.ndjson"
+REPLAY_DIR = os.path.join("data", "replay")
+
+
+def blob_path(root, digest):
+    return os.path.join(root, "blobs", digest[:2], f"{digest}.xml.gz")
+
+
+def archive_feeds(fetched, fetched_at, root=ARCHIVE_DIR):
+    # `fetched` as returned by fetch_all; unchanged feeds (body None) are skipped.
+    # Returns the number of new blobs written.
+    entries = []
+    written = 0
+    for geo, lang, country, body in fetched:
+        if body is None:
+            continue
+        digest = hashlib.sha256(body).hexdigest()
+        path = blob_path(root, digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(gzip.compress(body, compresslevel=6))
+            os.replace(tmp_path, path)
+            written += 1
+        entries.append({
+            "geo": geo,
+            "language": lang,
+            "country": country,
+            "fetched_at": fetched_at,
+            "sha256": digest,
+            "bytes": len(body),
+        })
+
+    if entries:
+        os.makedirs(root, exist_ok=True)
+        with open(os.path.join(root, MANIFEST_NAME), "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n" for entry in entries))
+    return written
+
+
+def read_manifest(root=ARCHIVE_DIR, geos=None, start=None, end=None):
+    path = os.path.join(root, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return []
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if geos and entry["geo"] not in geos:
+                continue
+            if start and entry["fetched_at"][:10] < start:
+                continue
+            if end and entry["fetched_at"][:10] > end:
+                continue
+            entries.append(entry)
+    return entries
+
+
+def load_blob(root, digest):
+    with open(blob_path(root, digest), "rb") as f:
+        return gzip.decompress(f.read())
+
+
+def replay_snapshot(root, fetched_at, entries):
+    # Runs in a worker process: parse and normalize one archived snapshot.
+    from extractor import build_rows
+    from normalize import normalize_rows
+
+    fetched = [
+        (entry["geo"], entry["language"], entry["country"], load_blob(root, entry["sha256"]))
+        for entry in entries
+    ]
+    rows, _, pub_dates = build_rows(fetched, fetched_at)
+    return normalize_rows(rows, pub_dates)
+
+
+def replay(root=ARCHIVE_DIR, out_dir=REPLAY_DIR, workers=None, geos=None, start=None, end=None, feeds=FEEDS):
+    # Rebuilds the snapshot CSV from the archive alone: snapshots are parsed
+    # in parallel, then translated from the translation cache (no network;
+    # strings it does not know keep their original text), their links
+    # interned and appended with the usual dedup, oldest snapshot first.
+    from extractor import SKIP_TRANSLATION
+    from links import LinkTable, intern_rows
+    from row_index import append_new_rows
+    from translation_cache import TranslationCache
+    from translation_plan import apply_translations, plan_translations
+
+    geo_order = {geo: i for i, (geo, _, _) in enumerate(feeds)}
+    snapshots = {}
+    for entry in read_manifest(root, geos, start, end):
+        snapshots.setdefault(entry["fetched_at"], []).append(entry)
+    if not snapshots:
+        print(f"Nothing to replay in {root}", flush=True)
+        return 0
+
+    os.makedirs(out_dir, exist_ok=True)
+    csv_path = os.path.join(out_dir, "trending_now_snapshot.csv")
+    cache = TranslationCache()
+    # Ids are content hashes, so the replay's own link table matches the live one.
+    links = LinkTable(os.path.join(out_dir, "links.csv"))
+    written = skipped = 0
+    ordered = sorted(snapshots)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            batches = pool.map(
+                replay_snapshot,
+                [root] * len(ordered),
+                ordered,
+                [sorted(snapshots[s], key=lambda e: geo_order.get(e["geo"], len(geo_order))) for s in ordered],
+                chunksize=max(1, len(ordered) // (4 * (workers or os.cpu_count() or 1))),
+            )
+            for rows in batches:
+                if not rows:
+                    continue
+                text_columns = [
+                    col for col in rows[0]
+                    if not any(skip in col.lower() for skip in SKIP_TRANSLATION)
+                ]
+                plan = plan_translations(rows, text_columns)
+                translations = {}
+                for lang, texts in plan.items():
+                    for text in texts:
+                        translated = cache.get(lang, text)
+                        if translated is not None:
+                            translations[(lang, text)] = translated
+                apply_translations(rows, text_columns, translations)
+                rows = intern_rows(rows, links)
+                links.flush()
+                new, dropped = append_new_rows(rows, csv_path)
+                written += new
+                skipped += dropped
+    finally:
+        cache.close()
+        links.close()
+
+    print(
+        f"Replayed {len(ordered)} snapshots into {csv_path}: {written} rows written, {skipped} duplicates",
+        flush=True
+    )
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archived raw feeds: list them or rebuild the dataset offline.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    list_parser = sub.add_parser("list", help="summarize the manifest")
+    replay_parser = sub.add_parser("replay", help="re-run parse/normalize/dedup over the archive")
+    for p in (list_parser, replay_parser):
+        p.add_argument("--root", default=ARCHIVE_DIR)
+        p.add_argument("--geo", action="append", dest="geos", help="only this geo (repeatable)")
+        p.add_argument("--start", help="first snapshot date (YYYY-MM-DD)")
+        p.add_argument("--end", help="last snapshot date (YYYY-MM-DD)")
+    replay_parser.add_argument("--out", default=REPLAY_DIR)
+    replay_parser.add_argument("--workers", type=int, help="processes (default: all cores)")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        entries = read_manifest(args.root, args.geos, args.start, args.end)
+        blobs = {entry["sha256"] for entry in entries}
+        print(
+            f"{len(entries)} fetches over {len({e['fetched_at'] for e in entries})} snapshots, "
+            f"{len(blobs)} distinct bodies", flush=True
+        )
+    else:
+        replay(args.root, args.out, args.workers, args.geos, args.start, args.end)
@@ -0,0 +1,249 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sqlite_store import DB_PATH
+
+HOST = os.getenv("API_HOST", "127.0.0.1")
+PORT = int(os.getenv("API_PORT", "8080"))
+# How much history (days before the newest snapshot) is held in memory.
+HISTORY_DAYS = int(os.getenv("API_HISTORY_DAYS", "7"))
+# The store is checked this often (seconds) and reloaded when it changed.
+RELOAD_INTERVAL = 5
+# Answers to other queries are kept per loaded view, oldest dropped first.
+QUERY_CACHE_SIZE = 256
+
+Payload = namedtuple("Payload", ["body", "gzipped", "etag", "gzip_etag"])
+
+
+def make_payload(obj):
+    # The ETag is a hash of the data alone (when the view was loaded goes in
+    # the X-Loaded-At header), so a reload that did not change an answer
+    # keeps its ETag and clients keep getting 304s. The gzip representation
+    # has its own ETag, as a cache must not take one for the other.
+    body = json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    digest = hashlib.blake2b(body, digest_size=12).hexdigest()
+    return Payload(body, gzip.compress(body, compresslevel=6), f'"{digest}"', f'"{digest}-gzip"')
+
+
+def load_trends(db_path=DB_PATH, history_days=HISTORY_DAYS):
+    # Trends of the snapshots within `history_days` of the newest one, in
+    # snapshot order, each with its full news item list. Link ids are
+    # resolved; rows stored before the links table still hold the URL.
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        newest = conn.execute("SELECT MAX(taken_at) FROM snapshots").fetchone()[0]
+        if newest is None:
+            return []
+        cutoff = (datetime.strptime(newest, "%Y-%m-%d %H:%M:%S") - timedelta(days=history_days)).strftime(
+            "%Y-%m-%d %H:%M:%S")
+
+        trends = {}
+        for row in conn.execute(
+            """
+            SELECT t.id, sn.taken_at, t.geo, t.country, t.language, t.title, t.traffic,
+                   t.date, t.start_time, t.end_time, COALESCE(lp.url, t.picture_url), t.summary
+            FROM trends t JOIN snapshots sn ON sn.id = t.snapshot_id
+            LEFT JOIN links lp ON lp.id = t.picture_url
+            WHERE sn.taken_at >= ?
+            ORDER BY sn.taken_at, t.id
+            """,
+            (cutoff,),
+        ):
+            trend_id, snapshot, geo, country, language, title, traffic, date, start, end, picture, summary = row
+            trends[trend_id] = {
+                "snapshot": snapshot, "geo": geo, "country": country, "language": language,
+                "title": title, "traffic": traffic, "date": date, "start_time": start, "end_time": end,
+                "picture_url": picture, "summary": summary, "news": [],
+            }
+
+        for trend_id, title, url, picture, source in conn.execute(
+            """
+            SELECT n.trend_id, n.title, COALESCE(lu.url, n.url), COALESCE(lp.url, n.picture_url), s.name
+            FROM news_items n
+            JOIN trends t ON t.id = n.trend_id
+            JOIN snapshots sn ON sn.id = t.snapshot_id
+            LEFT JOIN sources s ON s.id = n.source_id
+            LEFT JOIN links lu ON lu.id = n.url
+            LEFT JOIN links lp ON lp.id = n.picture_url
+            WHERE sn.taken_at >= ?
+            ORDER BY n.trend_id, n.position
+            """,
+            (cutoff,),
+        ):
+            trends[trend_id]["news"].append({"title": title, "url": url, "picture_url": picture, "source": source})
+        return list(trends.values())
+    finally:
+        conn.close()
+
+
+class View:
+    # Everything requests are answered from, built once per reload and never
+    # changed afterwards; a reload builds a new View and swaps it in.
+    def __init__(self, trends, loaded_at):
+        self.trends = trends
+        self.loaded_at = loaded_at
+        self.latest = {}
+        for trend in trends:
+            self.latest[trend["geo"]] = max(self.latest.get(trend["geo"], ""), trend["snapshot"])
+        self.geos = sorted(self.latest)
+        self.memo = {}
+        self.lock = threading.Lock()
+
+        # The requests dashboards make all the time: latest snapshot, all
+        # geos together and each geo on its own.
+        self.payloads = {}
+        for geos in [()] + [(geo,) for geo in self.geos]:
+            key = (geos, None, None, 0)
+            self.payloads[key] = self._build(*key)
+        self.geos_payload = make_payload({
+            "geos": [{"geo": geo, "latest_snapshot": self.latest[geo]} for geo in self.geos],
+        })
+
+    def _build(self, geos, start, end, min_traffic):
+        if start is None and end is None:
+            rows = [t for t in self.trends if t["snapshot"] == self.latest[t["geo"]]]
+        else:
+            rows = [
+                t for t in self.trends
+                if (start is None or t["snapshot"][:10] >= start) and (end is None or t["snapshot"][:10] <= end)
+            ]
+        if geos:
+            rows = [t for t in rows if t["geo"] in geos]
+        if min_traffic:
+            rows = [t for t in rows if (t["traffic"] or 0) >= min_traffic]
+        return make_payload({"count": len(rows), "trends": rows})
+
+    def query(self, geos=(), start=None, end=None, min_traffic=0):
+        key = (tuple(sorted(set(geos))), start, end, min_traffic)
+        payload = self.payloads.get(key) or self.memo.get(key)
+        if payload is None:
+            payload = self._build(*key)
+            with self.lock:
+                self.memo[key] = payload
+                while len(self.memo) > QUERY_CACHE_SIZE:
+                    self.memo.pop(next(iter(self.memo)))
+        return payload
+
+
+def load_view(db_path=DB_PATH, history_days=HISTORY_DAYS):
+    trends = load_trends(db_path, history_days) if os.path.exists(db_path) else []
+    return View(trends, datetime.now(timezone.utc).isoformat(timespec="seconds"))
+
+
+def parse_query(query):
+    geos = [geo.upper() for value in query.get("geo", []) for geo in value.split(",") if geo]
+    start = query.get("start", [None])[0]
+    end = query.get("end", [None])[0]
+    for value in (start, end):
+        if value is not None:
+            datetime.strptime(value, "%Y-%m-%d")
+    min_traffic = int(query.get("min_traffic", ["0"])[0])
+    return geos, start, end, min_traffic
+
+
+class TrendsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, db_path=DB_PATH, history_days=HISTORY_DAYS):
+        self.db_path = db_path
+        self.history_days = history_days
+        self.mtime = None
+        self.view = None
+        self.reload()
+        super().__init__(address, Handler)
+
+    def reload(self, force=True):
+        mtime = os.path.getmtime(self.db_path) if os.path.exists(self.db_path) else None
+        if not force and mtime == self.mtime:
+            return False
+        self.view = load_view(self.db_path, self.history_days)
+        self.mtime = mtime
+        return True
+
+    def watch(self, interval=RELOAD_INTERVAL):
+        while True:
+            time.sleep(interval)
+            try:
+                if self.reload(force=False):
+                    print(f"Reloaded {len(self.view.trends)} trends from {self.db_path}", flush=True)
+            except sqlite3.Error as e:
+                # A run may be writing right now; the next check tries again.
+                print(f"Reload failed: {e}", flush=True)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        view = self.server.view
+        if url.path == "/trends":
+            try:
+                payload = view.query(*parse_query(urllib.parse.parse_qs(url.query)))
+            except ValueError as e:
+                return self.send_payload(make_payload({"error": str(e)}), status=400)
+        elif url.path == "/geos":
+            payload = view.geos_payload
+        elif url.path == "/health":
+            payload = make_payload({"status": "ok", "loaded_at": view.loaded_at, "trends": len(view.trends)})
+        else:
+            return self.send_payload(make_payload({"error": "not found"}), status=404)
+        self.send_payload(payload)
+
+    def send_payload(self, payload, status=200):
+        use_gzip = "gzip" in self.headers.get("Accept-Encoding", "")
+        etag = payload.gzip_etag if use_gzip else payload.etag
+        # Either ETag means the client has the current data.
+        if_none_match = self.headers.get("If-None-Match", "")
+        if status == 200 and (payload.etag in if_none_match or payload.gzip_etag in if_none_match):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Vary", "Accept-Encoding")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        body = payload.gzipped if use_gzip else payload.body
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("ETag", etag)
+        self.send_header("X-Loaded-At", self.server.view.loaded_at)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Vary", "Accept-Encoding")
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the stored trends over HTTP from memory.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--history-days", type=int, default=HISTORY_DAYS)
+    args = parser.parse_args()
+
+    server = TrendsServer((args.host, args.port), args.db, args.history_days)
+    threading.Thread(target=server.watch, daemon=True).start()
+    print(f"Serving {len(server.view.trends)} trends on http://{args.host}:{args.port}/trends", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping API...", flush=True)
+    finally:
+        server.server_close()
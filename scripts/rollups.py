@@ -0,0 +1,295 @@
+import argparse
+import heapq
+import io
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+
+from normalize import normalize_title
+from sqlite_store import DB_PATH, connect
+
+ROLLUP_DIR = os.path.join("data", "rollups")
+VOCAB_NAME = "vocab.json"
+SNAPSHOT_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+GRAINS = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+# Weeks start on Monday; 1970-01-01 was a Thursday.
+WEEK_OFFSET = 3 * 86400
+ORDER_BY = ("max", "sum", "count")
+
+# Each (bucket, geo, trend) cell is one int64 key, so a rollup is a set of
+# parallel arrays sorted by key and a time window is a contiguous slice.
+GEO_BITS = 12
+TREND_BITS = 28
+COLUMNS = ("keys", "max", "sum", "count", "first_seen", "last_seen")
+
+
+def to_epoch(snapshot):
+    return int(datetime.strptime(snapshot, SNAPSHOT_FORMAT).replace(tzinfo=timezone.utc).timestamp())
+
+
+def from_epoch(epoch):
+    return datetime.fromtimestamp(int(epoch), timezone.utc).strftime(SNAPSHOT_FORMAT)
+
+
+def bucket_of(epochs, grain):
+    epochs = np.asarray(epochs, dtype=np.int64)
+    if grain == "week":
+        return (epochs + WEEK_OFFSET) // GRAINS["week"]
+    return epochs // GRAINS[grain]
+
+
+def encode(buckets, geo_ids, trend_ids):
+    buckets = np.asarray(buckets, dtype=np.int64)
+    geo_ids = np.asarray(geo_ids, dtype=np.int64)
+    trend_ids = np.asarray(trend_ids, dtype=np.int64)
+    return (buckets << (GEO_BITS + TREND_BITS)) | (geo_ids << TREND_BITS) | trend_ids
+
+
+def decode(keys):
+    return (
+        keys >> (GEO_BITS + TREND_BITS),
+        (keys >> TREND_BITS) & ((1 << GEO_BITS) - 1),
+        keys & ((1 << TREND_BITS) - 1),
+    )
+
+
+class Vocab:
+    # Geo and trend ids used in the keys. Trends are keyed by normalize_title
+    # and keep the first title they were seen with for display.
+    def __init__(self, geos=None, keys=None, titles=None):
+        self.geos = geos or []
+        self.keys = keys or []
+        self.titles = titles or []
+        self.geo_ids = {geo: i for i, geo in enumerate(self.geos)}
+        self.trend_ids = {key: i for i, key in enumerate(self.keys)}
+
+    def geo_id(self, geo):
+        if geo not in self.geo_ids:
+            self.geo_ids[geo] = len(self.geos)
+            self.geos.append(geo)
+        return self.geo_ids[geo]
+
+    def trend_id(self, title):
+        key = normalize_title(title)
+        if key not in self.trend_ids:
+            self.trend_ids[key] = len(self.keys)
+            self.keys.append(key)
+            self.titles.append(title)
+        return self.trend_ids[key]
+
+    @classmethod
+    def load(cls, root=ROLLUP_DIR):
+        path = os.path.join(root, VOCAB_NAME)
+        if not os.path.exists(path):
+            return cls()
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["geos"], data["keys"], data["titles"])
+
+    def save(self, root=ROLLUP_DIR):
+        os.makedirs(root, exist_ok=True)
+        path = os.path.join(root, VOCAB_NAME)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"geos": self.geos, "keys": self.keys, "titles": self.titles}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+def _empty():
+    return {col: np.zeros(0, dtype=np.int64) for col in COLUMNS}
+
+
+def _reduce(groups, size, traffic, epochs):
+    # max, sum, count, first and last seen per group id in `groups`.
+    out = {
+        "max": np.zeros(size, dtype=np.int64),
+        "sum": np.bincount(groups, weights=traffic, minlength=size).astype(np.int64),
+        "count": np.bincount(groups, minlength=size).astype(np.int64),
+        "first_seen": np.full(size, np.iinfo(np.int64).max, dtype=np.int64),
+        "last_seen": np.zeros(size, dtype=np.int64),
+    }
+    np.maximum.at(out["max"], groups, traffic)
+    np.minimum.at(out["first_seen"], groups, epochs)
+    np.maximum.at(out["last_seen"], groups, epochs)
+    return out
+
+
+class Rollup:
+    def __init__(self, grain, arrays=None):
+        self.grain = grain
+        self.arrays = arrays or _empty()
+
+    def __len__(self):
+        return len(self.arrays["keys"])
+
+    @classmethod
+    def load(cls, grain, root=ROLLUP_DIR):
+        path = os.path.join(root, f"{grain}.npz")
+        if not os.path.exists(path):
+            return cls(grain)
+        with np.load(path) as data:
+            return cls(grain, {col: data[col] for col in COLUMNS})
+
+    def save(self, root=ROLLUP_DIR):
+        os.makedirs(root, exist_ok=True)
+        path = os.path.join(root, f"{self.grain}.npz")
+        buffer = io.BytesIO()
+        np.savez(buffer, **self.arrays)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_path, path)
+
+    def add(self, epochs, geo_ids, trend_ids, traffic):
+        # Folds a batch of observations in: cells that already exist are
+        # updated in place, new cells are inserted at their sorted position.
+        epochs = np.asarray(epochs, dtype=np.int64)
+        traffic = np.asarray(traffic, dtype=np.int64)
+        keys = encode(bucket_of(epochs, self.grain), geo_ids, trend_ids)
+        cells, groups = np.unique(keys, return_inverse=True)
+        batch = _reduce(groups, len(cells), traffic, epochs)
+
+        a = self.arrays
+        pos = np.searchsorted(a["keys"], cells)
+        found = pos < len(a["keys"])
+        found[found] = a["keys"][pos[found]] == cells[found]
+
+        at = pos[found]
+        a["max"][at] = np.maximum(a["max"][at], batch["max"][found])
+        a["sum"][at] += batch["sum"][found]
+        a["count"][at] += batch["count"][found]
+        a["first_seen"][at] = np.minimum(a["first_seen"][at], batch["first_seen"][found])
+        a["last_seen"][at] = np.maximum(a["last_seen"][at], batch["last_seen"][found])
+
+        new = ~found
+        a["keys"] = np.insert(a["keys"], pos[new], cells[new])
+        for col in COLUMNS[1:]:
+            a[col] = np.insert(a[col], pos[new], batch[col][new])
+        return int(new.sum())
+
+    def last_bucket(self):
+        return int(decode(self.arrays["keys"][-1:])[0][0]) if len(self) else None
+
+    def top(self, vocab, k=10, geo=None, start=None, end=None, order_by="max"):
+        # Top `k` trends over the buckets from `start` to `end` (epochs,
+        # inclusive; default: the newest bucket), optionally for one geo.
+        # Only the window's slice of the arrays is touched.
+        if not len(self):
+            return []
+        first = bucket_of(start, self.grain) if start is not None else self.last_bucket()
+        last = bucket_of(end, self.grain) if end is not None else self.last_bucket()
+        lo, hi = np.searchsorted(self.arrays["keys"], encode([first, last + 1], 0, 0))
+        window = {col: self.arrays[col][lo:hi] for col in COLUMNS}
+
+        _, geo_ids, trend_ids = decode(window["keys"])
+        if geo is not None:
+            if geo not in vocab.geo_ids:
+                return []
+            mask = geo_ids == vocab.geo_ids[geo]
+            window = {col: values[mask] for col, values in window.items()}
+            geo_ids, trend_ids = geo_ids[mask], trend_ids[mask]
+        if not len(geo_ids):
+            return []
+
+        pairs, groups = np.unique((geo_ids << TREND_BITS) | trend_ids, return_inverse=True)
+        totals = {
+            "max": np.zeros(len(pairs), dtype=np.int64),
+            "sum": np.bincount(groups, weights=window["sum"], minlength=len(pairs)).astype(np.int64),
+            "count": np.bincount(groups, weights=window["count"], minlength=len(pairs)).astype(np.int64),
+            "first_seen": np.full(len(pairs), np.iinfo(np.int64).max, dtype=np.int64),
+            "last_seen": np.zeros(len(pairs), dtype=np.int64),
+        }
+        np.maximum.at(totals["max"], groups, window["max"])
+        np.minimum.at(totals["first_seen"], groups, window["first_seen"])
+        np.maximum.at(totals["last_seen"], groups, window["last_seen"])
+
+        ranking = totals[order_by]
+        best = heapq.nlargest(k, range(len(pairs)), key=lambda i: (ranking[i], totals["last_seen"][i]))
+        return [
+            {
+                "geo": vocab.geos[int(pairs[i] >> TREND_BITS)],
+                "title": vocab.titles[int(pairs[i] & ((1 << TREND_BITS) - 1))],
+                "max": int(totals["max"][i]),
+                "sum": int(totals["sum"][i]),
+                "count": int(totals["count"][i]),
+                "first_seen": from_epoch(totals["first_seen"][i]),
+                "last_seen": from_epoch(totals["last_seen"][i]),
+            }
+            for i in best
+        ]
+
+
+def _observations(vocab, rows):
+    # rows: (snapshot, geo, title, traffic) -> arrays for Rollup.add
+    rows = [row for row in rows if row[2]]
+    epochs = [to_epoch(snapshot) for snapshot, _, _, _ in rows]
+    geo_ids = [vocab.geo_id(geo) for _, geo, _, _ in rows]
+    trend_ids = [vocab.trend_id(title) for _, _, title, _ in rows]
+    traffic = [traffic or 0 for _, _, _, traffic in rows]
+    return epochs, geo_ids, trend_ids, traffic
+
+
+def update(records, snapshot, root=ROLLUP_DIR):
+    # Adds one stored snapshot's records to every grain. Returns the number
+    # of new (bucket, geo, trend) cells across grains.
+    vocab = Vocab.load(root)
+    observations = _observations(
+        vocab, [(snapshot, r["geo"], r["trend_title"], r["traffic"]) for r in records]
+    )
+    if not observations[0]:
+        return 0
+    # The vocab only grows, so saving it first keeps every stored id resolvable.
+    vocab.save(root)
+    added = 0
+    for grain in GRAINS:
+        rollup = Rollup.load(grain, root)
+        added += rollup.add(*observations)
+        rollup.save(root)
+    return added
+
+
+def rebuild(db_path=DB_PATH, root=ROLLUP_DIR):
+    conn = connect(db_path)
+    rows = conn.execute("""
+        SELECT sn.taken_at, t.geo, t.title, t.traffic
+        FROM trends t JOIN snapshots sn ON sn.id = t.snapshot_id
+    """).fetchall()
+    conn.close()
+
+    vocab = Vocab()
+    observations = _observations(vocab, rows)
+    vocab.save(root)
+    for grain in GRAINS:
+        rollup = Rollup(grain)
+        if observations[0]:
+            rollup.add(*observations)
+        rollup.save(root)
+    return len(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Traffic rollups per geo and trend.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    top_parser = sub.add_parser("top", help="leaderboard for a time window")
+    top_parser.add_argument("--geo")
+    top_parser.add_argument("--grain", choices=GRAINS, default="day")
+    top_parser.add_argument("--start", help="YYYY-MM-DD (default: the newest bucket)")
+    top_parser.add_argument("--end", help="YYYY-MM-DD (default: --start or the newest bucket)")
+    top_parser.add_argument("--by", choices=ORDER_BY, default="max")
+    top_parser.add_argument("-k", type=int, default=10)
+    rebuild_parser = sub.add_parser("rebuild", help="recompute every grain from the SQLite store")
+    rebuild_parser.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        print(f"Rolled up {rebuild(args.db)} trends into {os.path.abspath(ROLLUP_DIR)}", flush=True)
+    else:
+        start = to_epoch(f"{args.start} 00:00:00") if args.start else None
+        end = to_epoch(f"{args.end or args.start} 23:59:59") if args.end or args.start else None
+        results = Rollup.load(args.grain).top(Vocab.load(), args.k, args.geo, start, end, args.by)
+        for r in results:
+            print(f"{r['geo']:<3} {r['max']:>10} max {r['sum']:>11} sum {r['count']:>4}x  "
+                  f"{r['first_seen']} .. {r['last_seen']}  {r['title']}", flush=True)
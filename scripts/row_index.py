@@ -0,0 +1,218 @@
+import array
+import bisect
+import csv
+import hashlib
+import heapq
+import io
+import os
+
+# Sidecar file layout: a format marker, the size of the file it describes (so
+# a stale index is detected and rebuilt) and whether row offsets follow,
+# then the sorted 8-byte digests of every row and, if present, the byte
+# offset of each one's row in the same order. An index in an older layout
+# does not start with the marker and is rebuilt like a stale one.
+INDEX_SUFFIX = ".rowindex"
+INDEX_MAGIC = int.from_bytes(b"ROWIDX02", "little")
+
+
+def row_digest(values):
+    data = "\x1f".join(values).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+def _records(path):
+    # (byte offset, values) of every CSV record after the header. csv.reader
+    # takes one line at a time, so the bytes read before each record are
+    # where it starts, quoted newlines included.
+    with open(path, "rb") as f:
+        position = 0
+
+        def lines():
+            nonlocal position
+            for n, line in enumerate(f):
+                position += len(line)
+                yield line.decode("utf-8-sig" if n == 0 else "utf-8")
+
+        reader = csv.reader(lines())
+        header = next(reader, [])
+        yield None, header
+        while True:
+            start = position
+            values = next(reader, None)
+            if values is None:
+                return
+            yield start, values
+
+
+def _value(values, i):
+    return values[i] if i is not None and i < len(values) else ""
+
+
+class RowIndex:
+    # A sorted digest array plus the digests added since it was loaded. With
+    # `offsets` (CsvAppender) every digest also points at its row, so a hit
+    # can be confirmed against the row itself; two rows sharing a digest are
+    # both kept.
+    def __init__(self, digests=None, offsets=None):
+        self.digests = digests if digests is not None else array.array("Q")
+        self.offsets = offsets
+        self.added = {}
+
+    def __contains__(self, digest):
+        if digest in self.added:
+            return True
+        i = bisect.bisect_left(self.digests, digest)
+        return i < len(self.digests) and self.digests[i] == digest
+
+    def candidates(self, digest):
+        # Offsets of the rows with this digest.
+        lo = bisect.bisect_left(self.digests, digest)
+        hi = bisect.bisect_right(self.digests, digest, lo)
+        return list(self.offsets[lo:hi]) + self.added.get(digest, [])
+
+    def add(self, digest, offset=None):
+        self.added.setdefault(digest, []).append(offset)
+
+    def __len__(self):
+        return len(self.digests) + sum(len(offsets) for offsets in self.added.values())
+
+    @classmethod
+    def load(cls, index_path, csv_size):
+        if not os.path.exists(index_path):
+            return None
+        with open(index_path, "rb") as f:
+            header = array.array("Q")
+            try:
+                header.fromfile(f, 3)
+            except EOFError:
+                return None
+            if header[0] != INDEX_MAGIC or header[1] != csv_size:
+                return None
+            values = array.array("Q")
+            values.frombytes(f.read())
+        if not header[2]:
+            return cls(values)
+        n = len(values) // 2
+        return cls(values[:n], values[n:])
+
+    @classmethod
+    def build(cls, csv_path, key_columns):
+        records = _records(csv_path)
+        _, header = next(records)
+        positions = [header.index(col) if col in header else None for col in key_columns]
+        pairs = sorted(
+            (row_digest([_value(values, i) for i in positions]), offset)
+            for offset, values in records
+        )
+        return cls(array.array("Q", (d for d, _ in pairs)), array.array("Q", (o for _, o in pairs)))
+
+    def save(self, index_path, csv_size):
+        with_offsets = self.offsets is not None
+        if with_offsets:
+            added = sorted((digest, offset) for digest, offsets in self.added.items() for offset in offsets)
+            merged = list(heapq.merge(zip(self.digests, self.offsets), added))
+            values = array.array("Q", (d for d, _ in merged))
+            values.extend(o for _, o in merged)
+        else:
+            values = array.array("Q", heapq.merge(self.digests, sorted(self.added)))
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            array.array("Q", [INDEX_MAGIC, csv_size, with_offsets]).tofile(f)
+            values.tofile(f)
+        os.replace(tmp_path, index_path)
+
+
+class CsvAppender:
+    # Appends batches of row dicts to `csv_path`, skipping rows whose content
+    # (all columns but `exclude`) is already in the file. Old rows are never
+    # read back or rewritten, only the compact digest index next to the file,
+    # which is loaded on the first batch and saved by close(). A digest hit
+    # is confirmed by reading the one row it points at, so two rows that
+    # only share a digest are both kept.
+    def __init__(self, csv_path, exclude=("snapshot",)):
+        self.csv_path = csv_path
+        self.index_path = csv_path + INDEX_SUFFIX
+        self.exclude = exclude
+        self.file = None
+        self.source = None
+
+    def _open(self, columns):
+        self.columns = columns
+        self.key_columns = [col for col in columns if col not in self.exclude]
+        exists = os.path.exists(self.csv_path)
+
+        fieldnames = columns
+        if exists:
+            with open(self.csv_path, newline="", encoding="utf-8-sig") as f:
+                fieldnames = next(csv.reader(f), fieldnames)
+
+            self.index = RowIndex.load(self.index_path, os.path.getsize(self.csv_path))
+            if self.index is None or self.index.offsets is None:
+                self.index = RowIndex.build(self.csv_path, self.key_columns)
+        else:
+            self.index = RowIndex(offsets=array.array("Q"))
+        self.key_positions = [fieldnames.index(col) if col in fieldnames else None for col in self.key_columns]
+
+        mode, encoding = ("a", "utf-8") if exists else ("w", "utf-8-sig")
+        self.file = open(self.csv_path, mode, newline="", encoding=encoding)
+        self.writer = csv.DictWriter(self.file, fieldnames=fieldnames, extrasaction="ignore", lineterminator="\n")
+        if not exists:
+            self.writer.writeheader()
+        self.file.flush()
+        self.offset = os.path.getsize(self.csv_path)
+        # Rows are rendered here first so the byte offset of each is known.
+        self.line = io.StringIO()
+        self.line_writer = csv.DictWriter(self.line, fieldnames=fieldnames, extrasaction="ignore",
+                                          lineterminator="\n")
+
+    def _stored(self, offset, key):
+        # Whether the row at `offset` has exactly these key values.
+        if self.source is None:
+            self.source = open(self.csv_path, "rb")
+        self.file.flush()
+        self.source.seek(offset)
+        values = next(csv.reader(line.decode("utf-8") for line in self.source), [])
+        return [_value(values, i) for i in self.key_positions] == key
+
+    def append(self, rows):
+        if not rows:
+            return 0, 0
+        if self.file is None:
+            self._open(list(rows[0]))
+
+        # Render the values the way the csv module will write them (None as an
+        # empty field), so digests of new rows match rows read back from the file.
+        written = 0
+        for row in rows:
+            rendered = {col: "" if row.get(col) is None else str(row[col]) for col in self.columns}
+            key = [rendered[col] for col in self.key_columns]
+            digest = row_digest(key)
+            if any(self._stored(offset, key) for offset in self.index.candidates(digest)):
+                continue
+            self.line.seek(0)
+            self.line.truncate()
+            self.line_writer.writerow(rendered)
+            line = self.line.getvalue()
+            self.file.write(line)
+            self.index.add(digest, self.offset)
+            self.offset += len(line.encode("utf-8"))
+            written += 1
+        return written, len(rows) - written
+
+    def close(self):
+        if self.source is not None:
+            self.source.close()
+            self.source = None
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        self.index.save(self.index_path, os.path.getsize(self.csv_path))
+
+
+def append_new_rows(rows, csv_path, exclude=("snapshot",)):
+    appender = CsvAppender(csv_path, exclude)
+    try:
+        return appender.append(rows)
+    finally:
+        appender.close()
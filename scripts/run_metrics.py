@@ -0,0 +1,59 @@
+import json
+import os
+import resource
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+METRICS_PATH = os.path.join("data", "run_metrics.json")
+# One JSON object per run, appended, for watching run cost over time.
+HISTORY_PATH = os.path.join("data", "run_metrics.ndjson")
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS).
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+class RunMetrics:
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        wall = time.perf_counter()
+        # Stages of the streaming run work on their own threads at the same
+        # time; only the CPU of the thread running this stage counts.
+        cpu = time.thread_time()
+        entry = self.stages.setdefault(name, {})
+        try:
+            yield entry
+        finally:
+            # A stage entered more than once (poller batches) accumulates.
+            entry["wall_s"] = round(entry.get("wall_s", 0) + time.perf_counter() - wall, 4)
+            entry["cpu_s"] = round(entry.get("cpu_s", 0) + time.thread_time() - cpu, 4)
+            entry["peak_rss_mb"] = peak_rss_mb()
+
+    def add(self, stage, **values):
+        self.stages.setdefault(stage, {}).update(values)
+
+    def report(self):
+        return {
+            "snapshot": self.snapshot,
+            "finished_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "wall_s": round(time.perf_counter() - self.started, 4),
+            "cpu_s": round(time.process_time(), 4),
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": self.stages,
+        }
+
+    def write(self, path=METRICS_PATH, history_path=HISTORY_PATH):
+        report = self.report()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        with open(history_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(report, separators=(",", ":")) + "\n")
+        return report
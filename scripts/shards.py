@@ -0,0 +1,201 @@
+import argparse
+import base64
+import glob
+import gzip
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from deadline import Deadline
+from extractor import fetch, new_snapshot, prepare, store
+from feed_parser import NewsItem
+from fetch_feeds import FEEDS, load_feed_state, save_feed_state
+from raw_archive import archive_feeds
+from run_metrics import RunMetrics
+
+# Each shard leaves one part file here; `merge` stores them all and removes them.
+SHARD_DIR = os.path.join("data", "shards")
+# Columns that do not make two rows different (same rule as the row index).
+DEDUP_EXCLUDE = ("snapshot",)
+
+
+def shard_feeds(feeds, shard, shards):
+    # Round-robin over the registry order: every geo lands in exactly one
+    # shard and the shards stay balanced as the registry grows.
+    if not 0 <= shard < shards:
+        raise ValueError(f"shard must be between 0 and {shards - 1}, got {shard}")
+    return [feed for i, feed in enumerate(feeds) if i % shards == shard]
+
+
+def part_path(out_dir, shard, shards):
+    return os.path.join(out_dir, f"part-{shard:03d}-of-{shards:03d}.json")
+
+
+def run_shard(shard, shards, snapshot=None, out_dir=SHARD_DIR, feeds=FEEDS):
+    # Fetch, parse, normalize and translate one shard's geos. Nothing shared
+    # (CSV, Parquet, SQLite, raw archive, feed state) is written here, only
+    # the part file; it carries the raw bodies for merge to archive.
+    deadline = Deadline()
+    feeds = shard_feeds(feeds, shard, shards)
+    snapshot = snapshot or new_snapshot()
+    metrics = RunMetrics(snapshot)
+    feed_state = load_feed_state()
+
+    failures = {}
+    fetched = fetch(feeds, metrics, feed_state, deadline=deadline, failures=failures)
+    held_back = {}
+    raw = []
+
+    def keep_raw(entries, fetched_at):
+        raw.extend(
+            [geo, lang, country, base64.b64encode(gzip.compress(body, compresslevel=6)).decode("ascii")]
+            for geo, lang, country, body in entries if body is not None
+        )
+        return 0
+
+    records, news_by_row = prepare(fetched, snapshot, metrics, deadline=deadline, held_back=held_back,
+                                   archive=keep_raw)
+
+    geos = [geo for geo, _, _ in feeds]
+    part = {
+        "shard": shard,
+        "shards": shards,
+        "snapshot": snapshot,
+        "geos": geos,
+        "feed_state": {geo: feed_state[geo] for geo in geos if geo in feed_state and geo not in held_back},
+        "rows": records,
+        "news": [[list(news) for news in news_items] for news_items in news_by_row],
+        "raw": raw,
+        "unchanged": [geo for geo, _, _, body in fetched if body is None and geo not in failures],
+        "metrics": metrics.report(),
+    }
+
+    os.makedirs(out_dir, exist_ok=True)
+    path = part_path(out_dir, shard, shards)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(part, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    print(f"Shard {shard + 1}/{shards}: {len(records)} rows from {len(geos)} feeds -> {path}", flush=True)
+    return path
+
+
+def load_parts(in_dir=SHARD_DIR):
+    parts = []
+    for path in sorted(glob.glob(os.path.join(in_dir, "part-*.json"))):
+        with open(path, encoding="utf-8") as f:
+            parts.append((path, json.load(f)))
+    return parts
+
+
+def merge_rows(parts, feeds=FEEDS):
+    # Deterministic whatever order the shards finished in: rows are ordered
+    # by snapshot, then by the geo's place in the registry, then by their
+    # position in the feed. Rows repeated across parts (a shard uploaded
+    # twice, overlapping registries) are kept once.
+    geo_order = {geo: i for i, (geo, _, _) in enumerate(feeds)}
+    entries = [
+        (record, news_items)
+        for _, part in sorted(parts, key=lambda p: (p[1]["snapshot"], p[1]["shard"]))
+        for record, news_items in zip(part["rows"], part["news"])
+    ]
+    entries.sort(key=lambda e: (e[0]["snapshot"], geo_order.get(e[0]["geo"], len(geo_order))))
+
+    seen = set()
+    merged = []
+    for record, news_items in entries:
+        key = tuple((col, value) for col, value in record.items() if col not in DEDUP_EXCLUDE)
+        if key in seen:
+            continue
+        seen.add(key)
+        merged.append((record, [NewsItem(*news) for news in news_items]))
+    return merged, len(entries) - len(merged)
+
+
+def merge(in_dir=SHARD_DIR, feeds=FEEDS):
+    parts = load_parts(in_dir)
+    if not parts:
+        print(f"No shard parts in {in_dir}", flush=True)
+        return 0
+
+    expected = {part["shards"] for _, part in parts}
+    present = {(part["snapshot"], part["shard"]) for _, part in parts}
+    for snapshot in sorted({snapshot for snapshot, _ in present}):
+        missing = [i for i in range(max(expected)) if (snapshot, i) not in present]
+        if missing:
+            print(f"⚠️ Snapshot {snapshot} is missing shards {missing}; merging the rest.", flush=True)
+
+    merged, duplicates = merge_rows(parts, feeds)
+    metrics = RunMetrics(min(part["snapshot"] for _, part in parts))
+    metrics.add("merge", parts=len(parts), rows_in=len(merged) + duplicates, duplicates_dropped=duplicates)
+    for _, part in parts:
+        metrics.add(f"shard_{part['shard']}", **part["metrics"]["stages"])
+
+    blobs = 0
+    for _, part in parts:
+        fetched = [
+            (geo, lang, country, gzip.decompress(base64.b64decode(body)))
+            for geo, lang, country, body in part.get("raw", [])
+        ]
+        blobs += archive_feeds(fetched, part["snapshot"])
+    metrics.add("archive", blobs_written=blobs)
+
+    written = 0
+    by_snapshot = {part["snapshot"]: [] for _, part in parts}
+    unchanged = {}
+    for _, part in parts:
+        unchanged.setdefault(part["snapshot"], []).extend(part.get("unchanged", []))
+    for record, news_items in merged:
+        by_snapshot[record["snapshot"]].append((record, news_items))
+    for snapshot, entries in sorted(by_snapshot.items()):
+        if entries or unchanged[snapshot]:
+            written += store([record for record, _ in entries], [news_items for _, news_items in entries],
+                             snapshot, metrics, unchanged=unchanged[snapshot])
+
+    # Feed state only moves forward once the rows it vouches for are stored.
+    feed_state = load_feed_state()
+    for _, part in sorted(parts, key=lambda p: p[1]["snapshot"]):
+        feed_state.update(part["feed_state"])
+    save_feed_state(feed_state)
+    metrics.write()
+
+    for path, _ in parts:
+        os.remove(path)
+    print(f"Merged {len(parts)} shard parts: {len(merged)} rows, {duplicates} duplicates dropped", flush=True)
+    return written
+
+
+def run_local(workers, out_dir=SHARD_DIR, feeds=FEEDS):
+    # All shards of one snapshot as local processes, then a single merge.
+    snapshot = new_snapshot()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_shard, shard, workers, snapshot, out_dir, feeds) for shard in range(workers)]
+        for future in futures:
+            future.result()
+    return merge(out_dir, feeds)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the extraction as shards and merge their output.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    shard_cmd = commands.add_parser("run", help="process one shard of the feed registry")
+    shard_cmd.add_argument("--shard", type=int, required=True, help="0-based shard index")
+    shard_cmd.add_argument("--shards", type=int, required=True, help="total number of shards")
+    shard_cmd.add_argument("--snapshot", help="shared snapshot timestamp (defaults to now)")
+    shard_cmd.add_argument("--out", default=SHARD_DIR)
+
+    merge_cmd = commands.add_parser("merge", help="store every shard part and remove it")
+    merge_cmd.add_argument("--dir", default=SHARD_DIR)
+
+    local_cmd = commands.add_parser("local", help="run all shards as local processes, then merge")
+    local_cmd.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    local_cmd.add_argument("--dir", default=SHARD_DIR)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run_shard(args.shard, args.shards, args.snapshot, args.out)
+    elif args.command == "merge":
+        merge(args.dir)
+    else:
+        run_local(args.workers, args.dir)
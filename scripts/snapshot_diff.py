@@ -0,0 +1,141 @@
+import argparse
+import json
+import os
+
+from normalize import normalize_title
+
+# The last stored snapshot of every geo: {geo: {"snapshot", "trends": {key: [title, traffic]}}}.
+# That is all a diff needs; the CSV history is never read back.
+STATE_PATH = os.path.join("data", "last_snapshot.json")
+# One JSON line per change, for consumers that only want what moved.
+CHANGELOG_PATH = os.path.join("data", "changes.ndjson")
+
+CHANGE_KINDS = ("new", "dropped", "rising", "falling")
+
+
+def load_state(path=STATE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state, path=STATE_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def trends_by_geo(rows):
+    # {geo: {title key: [title, traffic]}}; a title listed twice keeps its highest traffic.
+    geos = {}
+    for row in rows:
+        if not row.get("trend_title"):
+            continue
+        trends = geos.setdefault(row["geo"], {})
+        key = normalize_title(row["trend_title"])
+        traffic = row.get("traffic")
+        if key not in trends or (traffic or 0) > (trends[key][1] or 0):
+            trends[key] = [row["trend_title"], traffic]
+    return geos
+
+
+def last_trends(state, geos):
+    # Feeds skipped as unchanged still list the trends of their last stored
+    # snapshot; these are them, as records (geo, trend_title, traffic) for
+    # the stores that count every snapshot a trend is seen in.
+    return [
+        {"geo": geo, "trend_title": title, "traffic": traffic}
+        for geo in geos if geo in state
+        for title, traffic in state[geo]["trends"].values()
+    ]
+
+
+def diff_geo(geo, snapshot, previous, current):
+    changes = []
+    for key, (title, traffic) in current.items():
+        if key not in previous:
+            kind, before = "new", None
+        else:
+            before = previous[key][1]
+            delta = (traffic or 0) - (before or 0)
+            if delta == 0:
+                continue
+            kind = "rising" if delta > 0 else "falling"
+        changes.append((kind, title, before, traffic))
+    for key, (title, before) in previous.items():
+        if key not in current:
+            changes.append(("dropped", title, before, None))
+
+    order = {kind: i for i, kind in enumerate(CHANGE_KINDS)}
+    changes.sort(key=lambda c: (order[c[0]], -abs((c[3] or 0) - (c[2] or 0)), c[1]))
+    return [
+        {
+            "snapshot": snapshot,
+            "geo": geo,
+            "change": kind,
+            "title": title,
+            "traffic": traffic,
+            "previous_traffic": before,
+            "delta": (traffic or 0) - (before or 0),
+        }
+        for kind, title, before, traffic in changes
+    ]
+
+
+def diff_snapshot(rows, snapshot, state):
+    # Compares each geo in `rows` with its last stored snapshot and moves the
+    # state forward. Geos absent from this run (unchanged or missing feeds)
+    # keep their state; a geo seen for the first time only sets a baseline.
+    changes = []
+    for geo, current in trends_by_geo(rows).items():
+        previous = state.get(geo)
+        if previous is not None and previous["snapshot"] >= snapshot:
+            continue
+        if previous is not None:
+            changes.extend(diff_geo(geo, snapshot, previous["trends"], current))
+        state[geo] = {"snapshot": snapshot, "trends": current}
+    return changes
+
+
+def append_changes(changes, path=CHANGELOG_PATH):
+    # The file is created even when there is nothing to append (a first run
+    # only records baselines), so it always exists for the workflow to commit.
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("".join(json.dumps(c, ensure_ascii=False, separators=(",", ":")) + "\n" for c in changes))
+
+
+def record_run(rows, snapshot, state_path=STATE_PATH, changelog_path=CHANGELOG_PATH):
+    state = load_state(state_path)
+    changes = diff_snapshot(rows, snapshot, state)
+    append_changes(changes, changelog_path)
+    save_state(state, state_path)
+    return changes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show recent trend changes between snapshots.")
+    parser.add_argument("--geo", action="append", dest="geos", help="only this geo (repeatable)")
+    parser.add_argument("--change", choices=CHANGE_KINDS, action="append", dest="kinds")
+    parser.add_argument("--last", type=int, default=50, help="how many changes to show")
+    parser.add_argument("--path", default=CHANGELOG_PATH)
+    args = parser.parse_args()
+
+    changes = []
+    if os.path.exists(args.path):
+        with open(args.path, encoding="utf-8") as f:
+            for line in f:
+                change = json.loads(line)
+                if args.geos and change["geo"] not in args.geos:
+                    continue
+                if args.kinds and change["change"] not in args.kinds:
+                    continue
+                changes.append(change)
+
+    for change in changes[-args.last:]:
+        delta = f"{change['delta']:+d}" if change["change"] != "new" else ""
+        print(f"{change['snapshot']}  {change['geo']:<3} {change['change']:<8} {delta:>9}  {change['title']}",
+              flush=True)
@@ -0,0 +1,198 @@
+import contextlib
+import os
+import sqlite3
+
+from links import canonicalize, is_link_id, link_id
+
+DB_PATH = os.path.join("data", "trends.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    taken_at TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+
+-- Canonical URLs under their content hash (see links.py); the URL columns
+-- below hold these ids.
+CREATE TABLE IF NOT EXISTS links (
+    id TEXT PRIMARY KEY,
+    url TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS trends (
+    id INTEGER PRIMARY KEY,
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id),
+    geo TEXT NOT NULL,
+    language TEXT,
+    country TEXT,
+    title TEXT,
+    original_title TEXT,
+    summary TEXT,
+    traffic INTEGER,
+    date TEXT,
+    start_time TEXT,
+    end_time TEXT,
+    picture_url TEXT
+);
+
+CREATE TABLE IF NOT EXISTS news_items (
+    id INTEGER PRIMARY KEY,
+    trend_id INTEGER NOT NULL REFERENCES trends (id),
+    position INTEGER NOT NULL,
+    title TEXT,
+    url TEXT,
+    picture_url TEXT,
+    source_id INTEGER REFERENCES sources (id)
+);
+
+-- Legacy CSV files already loaded by migrate_legacy.py.
+CREATE TABLE IF NOT EXISTS migrations (
+    path TEXT NOT NULL,
+    sha256 TEXT PRIMARY KEY,
+    schema TEXT NOT NULL,
+    rows INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS trends_geo_date ON trends (geo, date);
+CREATE INDEX IF NOT EXISTS trends_title_geo ON trends (title, geo);
+CREATE INDEX IF NOT EXISTS trends_snapshot ON trends (snapshot_id);
+CREATE INDEX IF NOT EXISTS news_items_trend ON news_items (trend_id, position);
+CREATE INDEX IF NOT EXISTS news_items_source ON news_items (source_id);
+CREATE INDEX IF NOT EXISTS news_items_url ON news_items (url);
+
+-- Same shape as data/trending_now_snapshot.csv (first three news items per trend).
+CREATE VIEW IF NOT EXISTS snapshot_rows AS
+SELECT
+    t.geo, t.language, t.country, t.title AS trend_title, t.traffic,
+    t.date, t.start_time, t.end_time, t.picture_url,
+    n1.title AS news_item_title_1, n1.url AS news_item_url_1,
+    n1.picture_url AS news_item_picture_1, s1.name AS news_item_source_1,
+    n2.title AS news_item_title_2, n2.url AS news_item_url_2,
+    n2.picture_url AS news_item_picture_2, s2.name AS news_item_source_2,
+    n3.title AS news_item_title_3, n3.url AS news_item_url_3,
+    n3.picture_url AS news_item_picture_3, s3.name AS news_item_source_3,
+    sn.taken_at AS snapshot
+FROM trends t
+JOIN snapshots sn ON sn.id = t.snapshot_id
+LEFT JOIN news_items n1 ON n1.trend_id = t.id AND n1.position = 1
+LEFT JOIN sources s1 ON s1.id = n1.source_id
+LEFT JOIN news_items n2 ON n2.trend_id = t.id AND n2.position = 2
+LEFT JOIN sources s2 ON s2.id = n2.source_id
+LEFT JOIN news_items n3 ON n3.trend_id = t.id AND n3.position = 3
+LEFT JOIN sources s3 ON s3.id = n3.source_id;
+"""
+
+
+def connect(path=DB_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _intern_source(conn, cache, name):
+    if not name:
+        return None
+    source_id = cache.get(name)
+    if source_id is None:
+        conn.execute("INSERT OR IGNORE INTO sources (name) VALUES (?)", (name,))
+        source_id = conn.execute("SELECT id FROM sources WHERE name = ?", (name,)).fetchone()[0]
+        cache[name] = source_id
+    return source_id
+
+
+def _intern_link(conn, cache, url):
+    if not url or is_link_id(url):
+        return url
+    key = cache.get(url)
+    if key is None:
+        canonical = canonicalize(url)
+        key = link_id(canonical)
+        conn.execute("INSERT OR IGNORE INTO links (id, url) VALUES (?, ?)", (key, canonical))
+        cache[url] = key
+    return key
+
+
+def import_links(conn, links):
+    # {id: url} from the CSV side table (links.load_links), for rows that
+    # already hold link ids when they reach the store.
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO links (id, url) VALUES (?, ?)", links.items())
+    return len(links)
+
+
+def transaction(conn, commit=True):
+    # `with transaction(conn):` is `with conn:`. With commit=False the
+    # statements join the caller's open transaction instead, and commit or
+    # roll back with the rest of it.
+    return conn if commit else contextlib.nullcontext()
+
+
+def write_run(conn, snapshot, records, news_by_record, commit=True):
+    # `records` are the flat snapshot rows (NaN already replaced by None) and
+    # `news_by_record[i]` is the full news item list of records[i] as
+    # (title, url, picture, source) tuples, not just the first three.
+    with transaction(conn, commit):
+        return _insert_run(conn, snapshot, records, news_by_record)
+
+
+def _insert_run(conn, snapshot, records, news_by_record):
+    sources = {}
+    links = {}
+    conn.execute("INSERT OR IGNORE INTO snapshots (taken_at) VALUES (?)", (snapshot,))
+    snapshot_id = conn.execute("SELECT id FROM snapshots WHERE taken_at = ?", (snapshot,)).fetchone()[0]
+
+    for record, news_items in zip(records, news_by_record):
+        cursor = conn.execute(
+            """
+            INSERT INTO trends (snapshot_id, geo, language, country, title, original_title,
+                                summary, traffic, date, start_time, end_time, picture_url)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                snapshot_id, record["geo"], record["language"], record["country"],
+                record["trend_title"], record.get("original_title"), record.get("summary"),
+                record["traffic"], record["date"],
+                record["start_time"], record["end_time"], _intern_link(conn, links, record["picture_url"]),
+            ),
+        )
+        trend_id = cursor.lastrowid
+        conn.executemany(
+            """
+            INSERT INTO news_items (trend_id, position, title, url, picture_url, source_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (trend_id, position, title, _intern_link(conn, links, url), _intern_link(conn, links, picture),
+                 _intern_source(conn, sources, source))
+                for position, (title, url, picture, source) in enumerate(news_items, start=1)
+            ],
+        )
+    return snapshot_id
+
+
+def set_summaries(conn, snapshot_id, summaries, commit=True):
+    # {(title, country): summary} for trends of a snapshot already written.
+    with transaction(conn, commit):
+        conn.executemany(
+            "UPDATE trends SET summary = ? WHERE snapshot_id = ? AND title = ? AND country = ?",
+            [(summary, snapshot_id, title, country) for (title, country), summary in summaries.items() if summary],
+        )
+
+
+def snapshots_for_trend(conn, title, geo=None):
+    query = """
+        SELECT sn.taken_at, t.geo, t.traffic
+        FROM trends t JOIN snapshots sn ON sn.id = t.snapshot_id
+        WHERE t.title = ?
+    """
+    params = [title]
+    if geo:
+        query += " AND t.geo = ?"
+        params.append(geo)
+    return conn.execute(query + " ORDER BY sn.taken_at", params).fetchall()
@@ -0,0 +1,251 @@
+import asyncio
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+
+from normalize import normalize_title
+from translation_cache import TranslationCache
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemma-3-4b:generateContent"
+
+# Free tier limits per model (see scripts/old_scripts/extract_trends_v3.py).
+MODEL_LIMITS = {
+    "gemma-3": {"MAX_RPM": 25, "MAX_TPM": 15_000, "MAX_RPD": 14_000, "TOKEN_ESTIMATE": 250},
+    "gemini-3": {"MAX_RPM": 6, "MAX_TPM": 300_000, "MAX_RPD": 100, "TOKEN_ESTIMATE": 450},
+    "2.5-flash-lite": {"MAX_RPM": 15, "MAX_TPM": 250_000, "MAX_RPD": 1000, "TOKEN_ESTIMATE": 350},
+    "2.5-flash": {"MAX_RPM": 9, "MAX_TPM": 250_000, "MAX_RPD": 250, "TOKEN_ESTIMATE": 350},
+    "2.0-flash": {"MAX_RPM": 14, "MAX_TPM": 1_000_000, "MAX_RPD": 200, "TOKEN_ESTIMATE": 350},
+}
+
+QUOTA_PATH = os.path.join("data", "gemini_quota.json")
+# Summaries share the translation cache's table layout: (country, normalized trend) -> text.
+SUMMARY_CACHE_PATH = os.path.join("data", "summary_cache.sqlite")
+WORKERS = int(os.getenv("GEMINI_WORKERS", "4"))
+
+
+def select_limits(url=GEMINI_URL):
+    for model, limits in MODEL_LIMITS.items():
+        if model in url:
+            return limits
+    return MODEL_LIMITS["2.0-flash"]
+
+
+LIMITS = select_limits()
+
+
+class TokenBucket:
+    # Refills continuously at `capacity` per `period` seconds; waiting callers
+    # sleep on the event loop instead of blocking the thread.
+    def __init__(self, capacity, period=60.0):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class DailyQuota:
+    # Requests used today (UTC), kept on disk so reruns and crashes don't reset it.
+    def __init__(self, limit, path=QUOTA_PATH):
+        self.limit = limit
+        self.path = path
+        self.day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        self.used = 0
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("day") == self.day:
+                self.used = state.get("used", 0)
+
+    def try_acquire(self):
+        if self.used >= self.limit:
+            return False
+        self.used += 1
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"day": self.day, "used": self.used}, f)
+        os.replace(tmp_path, self.path)
+        return True
+
+
+def build_prompt(trend, country):
+    return f"""
+קראת עכשיו על הטרנד "{trend}" שעלה בשעות האחרונות במדינת "{country}".
+סכם אותו בעברית טבעית וברורה, בשלוש שורות בלבד:
+
+1️כתוב בשורה אחת מהו נושא הטרנד (לדוגמה: ספורט, פוליטיקה, תרבות, אישיות מפורסמת וכו').
+2️ כתוב בשורה אחת מה קרה או מה מעורר עניין בטרנד הזה במדינה.
+3️ אם אפשר, הוסף בשורה השלישית הקשר קצר – למה אנשים מדברים על זה כעת.
+
+נא כתוב בסגנון תקשורתי, אנושי וענייני (לא כמו תרגום מכונה או רשימה יבשה).
+אל תשתמש במילים כמו "הטרנד הוא..." או "הנושא עוסק ב...", אלא ישר בתוכן.
+ענה רק בטקסט רגיל, ללא Markdown, ללא כותרות וללא אימוג׳ים.
+"""
+
+
+def call_gemini(trend, country, url=GEMINI_URL):
+    payload = {"contents": [{"parts": [{"text": build_prompt(trend, country)}]}]}
+    headers = {"x-goog-api-key": GEMINI_API_KEY}
+    r = requests.post(url, headers=headers, json=payload, timeout=(5, 20))
+    if r.status_code != 200:
+        raise RuntimeError(f"Gemini HTTP {r.status_code}: {r.text[:200]}")
+    data = r.json()
+    text = data.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
+    return text.strip() or None
+
+
+async def summarize_all(trends, limits=LIMITS, workers=WORKERS, cache=None, quota=None,
+                        call=call_gemini, retries=2, deadline=None, inbox=None, stop=None):
+    # `trends` is an iterable of (trend, country, traffic). Highest traffic is
+    # summarized first, so when the daily quota runs out it is the smallest
+    # trends that go without; the same goes for trends still queued when
+    # `deadline` passes. Returns {(trend, country): summary or None}.
+    # With `inbox` (a queue.Queue fed from another thread) more lists of
+    # trends keep arriving until None is put; `stop` (a threading.Event)
+    # ends the work early.
+    quota = quota or DailyQuota(limits["MAX_RPD"])
+    rpm = TokenBucket(limits["MAX_RPM"])
+    tpm = TokenBucket(limits["MAX_TPM"])
+    queue = asyncio.PriorityQueue()
+    results = {}
+    order = itertools.count()
+    closed = asyncio.Event()
+
+    def enqueue(batch):
+        for trend, country, traffic in batch:
+            if (trend, country) in results or not trend:
+                continue
+            key = normalize_title(trend)
+            cached = cache.get(country, key) if cache is not None else None
+            results[(trend, country)] = cached
+            if cached is None:
+                queue.put_nowait((-(traffic or 0), next(order), trend, country))
+
+    async def feed():
+        while True:
+            batch = await asyncio.to_thread(inbox.get)
+            if batch is None:
+                closed.set()
+                return
+            enqueue(batch)
+
+    def stopped():
+        return (deadline is not None and deadline.expired()) or (stop is not None and stop.is_set())
+
+    async def worker():
+        while True:
+            if stopped():
+                return
+            try:
+                _, _, trend, country = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                if closed.is_set():
+                    return
+                # More trends may still be on their way from the inbox.
+                await asyncio.sleep(0.1)
+                continue
+            for attempt in range(1, retries + 1):
+                if not quota.try_acquire():
+                    print("🛑 Reached daily Gemini request limit.", flush=True)
+                    return
+                await rpm.acquire()
+                await tpm.acquire(limits["TOKEN_ESTIMATE"])
+                try:
+                    summary = await asyncio.to_thread(call, trend, country)
+                except Exception as e:
+                    print(f"Attempt {attempt} failed for '{trend}': {e}", flush=True)
+                    await asyncio.sleep(min(30, attempt * 10))
+                    continue
+                if summary:
+                    results[(trend, country)] = summary
+                    if cache is not None:
+                        cache.put(country, normalize_title(trend), summary)
+                break
+
+    enqueue(trends)
+    if inbox is None:
+        closed.set()
+        await asyncio.gather(*(worker() for _ in range(max(1, workers))))
+    else:
+        feeder = asyncio.create_task(feed())
+        await asyncio.gather(*(worker() for _ in range(max(1, workers))))
+        if not feeder.done():
+            # Stopped early: the feeder is blocked on the inbox until the
+            # caller's final None arrives.
+            await feeder
+    return results
+
+
+def summarize_trends(trends, workers=WORKERS, deadline=None):
+    # Blocking entry point for a list of trends known up front.
+    if not GEMINI_API_KEY:
+        print("Missing GEMINI_API_KEY — skipping summaries.", flush=True)
+        return {}
+    cache = TranslationCache(SUMMARY_CACHE_PATH)
+    try:
+        return asyncio.run(summarize_all(trends, workers=workers, cache=cache, deadline=deadline))
+    finally:
+        cache.close()
+
+
+class BackgroundSummaries:
+    # Summaries on a background thread while a run is still fetching and
+    # translating: add() each batch of (trend, country, traffic) as it is
+    # stored, result() once the last one is in. One event loop and one set
+    # of rate limits serve the whole run.
+    def __init__(self, workers=WORKERS, deadline=None):
+        self.inbox = queue.Queue()
+        self.stop = threading.Event()
+        self.results = {}
+        self.thread = None
+        if not GEMINI_API_KEY:
+            print("Missing GEMINI_API_KEY — skipping summaries.", flush=True)
+            return
+        self.thread = threading.Thread(target=self._run, args=(workers, deadline), daemon=True)
+        self.thread.start()
+
+    def _run(self, workers, deadline):
+        cache = TranslationCache(SUMMARY_CACHE_PATH)
+        try:
+            self.results = asyncio.run(summarize_all(
+                [], workers=workers, cache=cache, deadline=deadline, inbox=self.inbox, stop=self.stop))
+        except Exception as e:
+            print(f"Summaries failed: {e}", flush=True)
+        finally:
+            cache.close()
+
+    def add(self, trends):
+        if self.thread is not None:
+            self.inbox.put(list(trends))
+
+    def result(self, cancel=False):
+        # {(trend, country): summary or None}; with cancel=True the trends
+        # still queued are dropped instead of waited for.
+        if self.thread is None:
+            return {}
+        if cancel:
+            self.stop.set()
+        self.inbox.put(None)
+        self.thread.join()
+        self.thread = None
+        return self.results
@@ -0,0 +1,137 @@
+import argparse
+import csv
+import glob
+import os
+import sqlite3
+import time
+
+from fetch_feeds import FEEDS
+
+CACHE_PATH = os.path.join("data", "translation_cache.sqlite")
+
+# Least recently used entries are dropped once the cache grows past this size.
+MAX_ENTRIES = int(os.getenv("TRANSLATION_CACHE_SIZE", "200000"))
+
+HISTORY_GLOBS = [
+    os.path.join("data", "trending_now_snapshot*.csv"),
+    os.path.join("data", "old_data", "trending_now_snapshot*.csv"),
+]
+
+
+class TranslationCache:
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Shard workers running side by side share the file; writers wait
+        # for each other instead of failing with "database is locked".
+        # The streaming run opens the cache on the main thread and uses it
+        # from the translate stage's thread (never from two at once).
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS translations (
+                source TEXT NOT NULL,
+                text TEXT NOT NULL,
+                translated TEXT NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (source, text)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS translations_last_used ON translations (last_used)")
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, source, text):
+        row = self.conn.execute(
+            "SELECT translated FROM translations WHERE source = ? AND text = ?", (source, text)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.conn.execute(
+            "UPDATE translations SET last_used = ? WHERE source = ? AND text = ?", (time.time(), source, text)
+        )
+        return row[0]
+
+    def put(self, source, text, translated):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO translations (source, text, translated, last_used) VALUES (?, ?, ?, ?)",
+            (source, text, translated, time.time()),
+        )
+
+    def translate(self, source, text, translate_fn):
+        translated = self.get(source, text)
+        if translated is None:
+            translated = translate_fn(text)
+            if translated:
+                self.put(source, text, translated)
+        return translated
+
+    def evict(self):
+        count = self.conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        extra = count - self.max_entries
+        if extra > 0:
+            self.conn.execute("""
+                DELETE FROM translations WHERE rowid IN (
+                    SELECT rowid FROM translations ORDER BY last_used LIMIT ?
+                )
+            """, (extra,))
+        return max(extra, 0)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def commit(self):
+        self.conn.commit()
+
+    def flush(self):
+        self.evict()
+        self.commit()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+def warm_from_history(cache, paths=None):
+    # Only the v1-v3 files kept the original title next to its translation,
+    # so those are the rows we can seed the cache from.
+    if paths is None:
+        paths = sorted(p for pattern in HISTORY_GLOBS for p in glob.glob(pattern))
+    country_languages = {country: lang for _, lang, country in FEEDS}
+
+    added = 0
+    for path in paths:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            reader = csv.DictReader(f)
+            if not {"country_en", "title_original", "title_english"} <= set(reader.fieldnames or []):
+                continue
+            for row in reader:
+                lang = country_languages.get(row["country_en"])
+                original = (row["title_original"] or "").strip()
+                english = (row["title_english"] or "").strip()
+                if lang and original and english and original != english:
+                    cache.put(lang, original, english)
+                    added += 1
+    return added
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the on-disk translation cache.")
+    parser.add_argument("--warm", nargs="*", metavar="CSV", help="pre-warm from snapshot history (default: all known files)")
+    parser.add_argument("--path", default=CACHE_PATH)
+    args = parser.parse_args()
+
+    cache = TranslationCache(args.path)
+    if args.warm is not None:
+        added = warm_from_history(cache, args.warm or None)
+        print(f"Warmed translation cache with {added} entries.", flush=True)
+    cache.evict()
+    total = cache.conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+    cache.close()
+    print(f"Translation cache: {total} entries in {os.path.abspath(args.path)}", flush=True)
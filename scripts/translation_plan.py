@@ -0,0 +1,84 @@
+import os
+
+BATCH_SIZE = int(os.getenv("TRANSLATION_BATCH_SIZE", "50"))
+
+# Feed language codes that Google Translate knows under another name.
+TRANSLATOR_LANGUAGES = {"he": "iw"}
+
+
+def is_english(text):
+    return all(ord(c) < 128 for c in text)
+
+
+def make_translator(lang):
+    # deep_translator (and its HTML parser) is only imported once a run
+    # actually has something the cache could not answer.
+    from deep_translator import GoogleTranslator
+
+    return GoogleTranslator(source=TRANSLATOR_LANGUAGES.get(lang, lang), target="en")
+
+
+def plan_translations(rows, columns, language_col="language", extra=()):
+    # {lang: [text, ...]} with every distinct non-English string of the run,
+    # in first-seen order so batches are reproducible. `extra` adds
+    # (lang, text) pairs that do not live in a row column.
+    plan = {}
+    seen = set()
+    pairs = [(row[language_col], row.get(col)) for col in columns for row in rows]
+    for lang, text in pairs + list(extra):
+        if isinstance(text, str) and not is_english(text) and (lang, text) not in seen:
+            seen.add((lang, text))
+            plan.setdefault(lang, []).append(text)
+    return plan
+
+
+def translate_plan(plan, cache=None, batch_size=BATCH_SIZE, deadline=None):
+    # Returns {(lang, text): translation}. Cached strings never reach the translator.
+    # Once `deadline` passes, the remaining batches keep their original text.
+    translations = {}
+    calls = 0
+    for lang, texts in plan.items():
+        pending = []
+        for text in texts:
+            cached = cache.get(lang, text) if cache is not None else None
+            if cached is None:
+                pending.append(text)
+            else:
+                translations[(lang, text)] = cached
+        # Commit as we go so the write lock is not held while the translator
+        # is working (other processes may be using the same cache).
+        if cache is not None:
+            cache.commit()
+
+        if not pending:
+            continue
+        translator = make_translator(lang)
+        for i in range(0, len(pending), batch_size):
+            chunk = pending[i:i + batch_size]
+            if deadline is not None and deadline.expired():
+                print(f"Run deadline reached, leaving {len(pending) - i} {lang} strings untranslated", flush=True)
+                break
+            calls += 1
+            try:
+                results = translator.translate_batch(chunk)
+            except Exception as e:
+                print(f"Translation batch failed for {lang} ({len(chunk)} strings): {e}", flush=True)
+                continue
+            for text, translated in zip(chunk, results):
+                if translated:
+                    translations[(lang, text)] = translated
+                    if cache is not None:
+                        cache.put(lang, text, translated)
+            if cache is not None:
+                cache.commit()
+    return translations, calls
+
+
+def apply_translations(rows, columns, translations, language_col="language"):
+    for row in rows:
+        lang = row[language_col]
+        for col in columns:
+            text = row.get(col)
+            if isinstance(text, str):
+                row[col] = translations.get((lang, text), text)
+    return rows
@@ -0,0 +1,115 @@
+import argparse
+
+from normalize import normalize_title
+from sqlite_store import DB_PATH, connect, transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trend_lifetimes (
+    geo TEXT NOT NULL,
+    title_key TEXT NOT NULL,
+    title TEXT,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    snapshots_seen INTEGER NOT NULL,
+    peak_traffic INTEGER,
+    latest_traffic INTEGER,
+    PRIMARY KEY (geo, title_key)
+);
+"""
+
+UPSERT = """
+INSERT INTO trend_lifetimes
+    (geo, title_key, title, first_seen, last_seen, snapshots_seen, peak_traffic, latest_traffic)
+VALUES (?, ?, ?, ?, ?, 1, ?, ?)
+ON CONFLICT (geo, title_key) DO UPDATE SET
+    title = excluded.title,
+    first_seen = MIN(first_seen, excluded.first_seen),
+    last_seen = MAX(last_seen, excluded.last_seen),
+    snapshots_seen = snapshots_seen + 1,
+    peak_traffic = CASE
+        WHEN peak_traffic IS NULL OR excluded.peak_traffic > peak_traffic THEN excluded.peak_traffic
+        ELSE peak_traffic
+    END,
+    latest_traffic = CASE
+        WHEN excluded.last_seen >= last_seen THEN excluded.latest_traffic
+        ELSE latest_traffic
+    END
+"""
+
+
+def ensure_schema(conn):
+    conn.executescript(SCHEMA)
+
+
+def update(conn, snapshot, records, commit=True):
+    # Touches only the (geo, title) keys present in this run; one row per key
+    # even if a feed lists the same trend twice. With commit=False the rows
+    # join the caller's open transaction, which has run ensure_schema before
+    # it started (executescript would commit it).
+    touched = {}
+    for record in records:
+        if not record.get("trend_title"):
+            continue
+        key = (record["geo"], normalize_title(record["trend_title"]))
+        traffic = record.get("traffic")
+        previous = touched.get(key)
+        if previous is None or (traffic or 0) > (previous[1] or 0):
+            touched[key] = (record["trend_title"], traffic)
+
+    if commit:
+        ensure_schema(conn)
+    with transaction(conn, commit):
+        conn.executemany(UPSERT, [
+            (geo, title_key, title, snapshot, snapshot, traffic, traffic)
+            for (geo, title_key), (title, traffic) in touched.items()
+        ])
+    return len(touched)
+
+
+def lookup(conn, geo, title):
+    ensure_schema(conn)
+    row = conn.execute(
+        """
+        SELECT title, first_seen, last_seen, snapshots_seen, peak_traffic, latest_traffic
+        FROM trend_lifetimes WHERE geo = ? AND title_key = ?
+        """,
+        (geo, normalize_title(title)),
+    ).fetchone()
+    if row is None:
+        return None
+    keys = ["title", "first_seen", "last_seen", "snapshots_seen", "peak_traffic", "latest_traffic"]
+    return dict(zip(keys, row))
+
+
+def rebuild(conn):
+    # One-off backfill from everything already in the store (e.g. after
+    # migrate_legacy.py), replayed snapshot by snapshot.
+    ensure_schema(conn)
+    with conn:
+        conn.execute("DELETE FROM trend_lifetimes")
+    snapshots = conn.execute("SELECT id, taken_at FROM snapshots ORDER BY taken_at").fetchall()
+    for snapshot_id, taken_at in snapshots:
+        records = [
+            {"geo": geo, "trend_title": title, "traffic": traffic}
+            for geo, title, traffic in conn.execute(
+                "SELECT geo, title, traffic FROM trends WHERE snapshot_id = ?", (snapshot_id,)
+            )
+        ]
+        update(conn, taken_at, records)
+    return len(snapshots)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query or rebuild the trend lifetime index.")
+    parser.add_argument("geo", nargs="?")
+    parser.add_argument("title", nargs="?")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild from all snapshots in the store")
+    parser.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    if args.rebuild:
+        print(f"Rebuilt trend lifetimes from {rebuild(conn)} snapshots", flush=True)
+    if args.geo and args.title:
+        print(lookup(conn, args.geo, args.title), flush=True)
+    conn.close()